@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
 
+import hmac
 import json
 import logging
+import time
 import jwt
 from odoo import http
 from odoo.http import request, Response
 
+from ..tools import gatewayapi_logging, gatewayapi_metrics, gatewayapi_webhook_auth
 
-_logger = logging.getLogger(__name__)
+
+_logger = gatewayapi_logging.get_logger(gatewayapi_logging.DLR)
 
 
 class GatewayApiWebhookController(http.Controller):
@@ -21,13 +25,19 @@ class GatewayApiWebhookController(http.Controller):
     )
     def gatewayapi_dlr_webhook(self, **kwargs):
         """Webhook to receive Delivery Reports (DLRs) from GatewayAPI."""
-        _logger.debug("GatewayAPI DLR: Received webhook with headers: %s",
-                      dict(request.httprequest.headers))
-
-        jwt_secret = request.env['ir.config_parameter'].sudo().get_param(
-            'gatewayapi.webhook_jwt_secret'
-        )
-        if not jwt_secret:
+        start = time.monotonic()
+        response = self._gatewayapi_dlr_webhook()
+        mode = 'async' if request.env['gatewayapi.dlr'].sudo()._get_webhook_auth_config()['async'] else 'sync'
+        gatewayapi_metrics.WEBHOOK_LATENCY.observe(time.monotonic() - start, mode=mode)
+        return response
+
+    def _gatewayapi_dlr_webhook(self):
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug("GatewayAPI DLR: Received webhook with headers: %s",
+                          dict(request.httprequest.headers))
+
+        auth_config = request.env['gatewayapi.dlr'].sudo()._get_webhook_auth_config()
+        if not auth_config['secrets']:
             _logger.error(
                 "GatewayAPI DLR: JWT secret not configured in system "
                 "parameters"
@@ -45,9 +55,7 @@ class GatewayApiWebhookController(http.Controller):
             )
 
         # Check if JWT verification is required
-        require_jwt = request.env['ir.config_parameter'].sudo().get_param(
-            'gatewayapi.webhook_require_jwt', 'true'
-        ).lower() == 'true'
+        require_jwt = auth_config['require_jwt']
 
         auth_header = request.httprequest.headers.get('X-Gwapi-Signature')
         if not auth_header:
@@ -76,9 +84,8 @@ class GatewayApiWebhookController(http.Controller):
         else:
             # Verify JWT if header is present
             try:
-                token = auth_header
-                jwt.decode(token, jwt_secret, algorithms=['HS256'])
-                _logger.info("GatewayAPI DLR: JWT verified successfully.")
+                gatewayapi_webhook_auth.verify(auth_header, auth_config['secrets'])
+                _logger.debug("GatewayAPI DLR: JWT verified successfully.")
 
             except jwt.ExpiredSignatureError:
                 _logger.warning("GatewayAPI DLR: JWT verification failed - "
@@ -120,12 +127,31 @@ class GatewayApiWebhookController(http.Controller):
                     mimetype='application/json'
                 )
 
+        # In asynchronous mode the report is only stored; the
+        # "GatewayAPI: Process delivery reports" cron applies it later.
+        if auth_config['async']:
+            raw_report = request.httprequest.get_data(as_text=True)
+            if not raw_report:
+                _logger.error("GatewayAPI DLR: Empty request body received")
+                return Response(
+                    json.dumps({
+                        'status': 'error',
+                        'message': 'Empty JSON data received'
+                    }),
+                    status=400,
+                    mimetype='application/json'
+                )
+            request.env['gatewayapi.dlr'].sudo()._enqueue(raw_report)
+            return Response(
+                json.dumps({
+                    'status': 'ok',
+                    'message': 'Webhook queued'
+                }),
+                status=200,
+                mimetype='application/json')
+
         try:
-            _logger.info("GatewayAPI DLR: Attempting to parse JSON data from "
-                         "request")
             data = request.get_json_data()
-            _logger.info("GatewayAPI DLR: Successfully parsed JSON data: %s", 
-                         data)
             if not data:
                 _logger.error("GatewayAPI DLR: Empty JSON data received")
                 return Response(
@@ -161,27 +187,15 @@ class GatewayApiWebhookController(http.Controller):
                 mimetype='application/json'
             )
 
-        gw_message_id = data.get('id')
-        status = data.get('status')
-        error = data.get('error')
-
-        _logger.info(
+        _logger.debug(
             "GatewayAPI DLR Webhook received data%s: %s for message ID %s",
             " (JWT verified)" if auth_header else "",
-            json.dumps(data), gw_message_id
+            data, data.get('id')
         )
 
-        SmsMessage = request.env['sms.sms'].sudo()
-        sms_message = SmsMessage.search(
-            [('gatewayapi_message_id', '=', str(gw_message_id))], limit=1
-        )
+        sms_message = request.env['sms.sms'].sudo()._gatewayapi_apply_delivery_report(data)
 
         if not sms_message:
-            _logger.warning(
-                "GatewayAPI DLR: No sms.sms record found for "
-                "gatewayapi_message_id: %s",
-                gw_message_id
-            )
             return Response(
                 json.dumps({
                     'status': 'ok',
@@ -190,39 +204,6 @@ class GatewayApiWebhookController(http.Controller):
                 status=200,
                 mimetype='application/json')
 
-        original_odoo_state = sms_message.state
-        new_odoo_state = original_odoo_state
-        failure_type = sms_message.failure_type
-
-        if status == 'DELIVERED':
-            new_odoo_state = 'sent'
-            failure_type = False
-        elif status == 'ACCEPTED':
-            new_odoo_state = 'sent'
-            failure_type = False
-        elif status == 'UNDELIVERABLE':
-            new_odoo_state = 'error'
-            failure_type = 'sms_unregistered'
-        elif status == 'REJECTED':
-            new_odoo_state = 'error'
-            failure_type = 'sms_blacklist'
-        elif status in ['EXPIRED', 'SKIPPED']:
-            new_odoo_state = 'error'
-            failure_type = 'sms_other'
-
-        if (new_odoo_state != original_odoo_state or 
-                failure_type != sms_message.failure_type):
-            sms_message.write({
-                'state': new_odoo_state,
-                'failure_type': failure_type,
-                'sms_api_error': error if error else False
-            })
-            _logger.info(
-                "GatewayAPI DLR: Updated SMS %s state from %s to %s "
-                "(GatewayAPI status: %s)",
-                gw_message_id, original_odoo_state, new_odoo_state, status
-            )
-
         return Response(
             json.dumps({
                 'status': 'ok',
@@ -230,3 +211,28 @@ class GatewayApiWebhookController(http.Controller):
             }),
             status=200,
             mimetype='application/json')
+
+    @http.route(
+        '/gatewayapi/metrics',
+        type='http',
+        auth='public',
+        methods=['GET'],
+        csrf=False
+    )
+    def gatewayapi_metrics(self, **kwargs):
+        """Metrics of this worker process in the Prometheus text format.
+
+        Disabled unless the gatewayapi.metrics_token system parameter is
+        set; scrapers authenticate with "Authorization: Bearer <token>".
+        """
+        token = request.env['ir.config_parameter'].sudo().get_param('gatewayapi.metrics_token')
+        if not token:
+            return request.not_found()
+        auth_header = request.httprequest.headers.get('Authorization', '')
+        if not hmac.compare_digest(auth_header.encode(), f'Bearer {token}'.encode()):
+            _logger.warning("GatewayAPI metrics: rejected request with invalid token")
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(
+            gatewayapi_metrics.render(),
+            status=200,
+            content_type='text/plain; version=0.0.4; charset=utf-8')
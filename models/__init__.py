@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
 
+from . import gatewayapi_dlr
+from . import gatewayapi_message_lookup
+from . import gatewayapi_price
+from . import gatewayapi_rate_bucket
 from . import iap_account
 from . import sms_sms
 from . import sms_resend_recipient
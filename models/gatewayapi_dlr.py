@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, fields, models, tools
+from odoo.tools import frozendict
+import json
+import re
+
+from ..tools import gatewayapi_logging
+
+_logger = gatewayapi_logging.get_logger(gatewayapi_logging.DLR)
+
+DLR_QUEUE_BATCH_SIZE = 1000
+SECRET_SEPARATORS = re.compile(r'[\s,]+')
+
+
+class GatewayApiDlr(models.Model):
+    """Staging table for delivery reports received in asynchronous webhook
+    mode. The webhook only appends the raw report; the queue is drained in
+    bulk by a cron, so webhook latency does not depend on the size of the
+    ``sms_sms`` table."""
+    _name = "gatewayapi.dlr"
+    _description = "GatewayAPI Delivery Report Queue"
+    _order = "id"
+    _log_access = False
+
+    payload = fields.Text(required=True, readonly=True)
+    received_at = fields.Datetime(readonly=True, default=fields.Datetime.now)
+
+    @api.model
+    @tools.ormcache()
+    def _get_webhook_auth_config(self):
+        """Webhook settings from the system parameters, cached per worker.
+
+        Any ``ir.config_parameter`` change clears the registry cache, so the
+        cached values follow updates and secret rotations. Active secrets are
+        ``gatewayapi.webhook_jwt_secret`` followed by the comma or whitespace
+        separated ``gatewayapi.webhook_jwt_secret_previous`` ones.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        secrets = [ICP.get_param('gatewayapi.webhook_jwt_secret') or '']
+        secrets += SECRET_SEPARATORS.split(ICP.get_param('gatewayapi.webhook_jwt_secret_previous') or '')
+        return frozendict({
+            'secrets': tuple(secret for secret in secrets if secret),
+            'require_jwt': (ICP.get_param('gatewayapi.webhook_require_jwt', 'true') or '').lower() == 'true',
+            'async': (ICP.get_param('gatewayapi.webhook_async', 'false') or '').lower() == 'true',
+        })
+
+    @api.model
+    def _enqueue(self, raw_report):
+        """Append a raw report with a single INSERT, bypassing the ORM."""
+        self.env.cr.execute(
+            "INSERT INTO gatewayapi_dlr (payload, received_at) VALUES (%s, now() at time zone 'UTC')",
+            [raw_report],
+        )
+
+    @api.model
+    def _cron_process_queue(self, batch_size=DLR_QUEUE_BATCH_SIZE):
+        """Apply queued delivery reports, oldest first, one batch per
+        transaction. Rows locked by a concurrent run are skipped."""
+        SmsSudo = self.env['sms.sms'].sudo()
+        while True:
+            self.env.cr.execute(
+                """SELECT id, payload FROM gatewayapi_dlr
+                    ORDER BY id
+                    LIMIT %s
+                      FOR UPDATE SKIP LOCKED""",
+                [batch_size],
+            )
+            rows = self.env.cr.fetchall()
+            if not rows:
+                break
+            reports = []
+            for __, payload in rows:
+                try:
+                    data = json.loads(payload)
+                except ValueError:
+                    _logger.error("GatewayAPI DLR queue: dropping invalid JSON report: %s", payload[:200])
+                    continue
+                if not isinstance(data, dict) or not all(k in data for k in ('id', 'status')):
+                    _logger.warning("GatewayAPI DLR queue: dropping report without id/status: %s", data)
+                    continue
+                reports.append((data['id'], data['status'], data.get('error'), data.get('time'), data.get('msisdn')))
+            SmsSudo._gatewayapi_apply_delivery_reports(reports)
+            self.env.cr.execute("DELETE FROM gatewayapi_dlr WHERE id = ANY(%s)", [[row[0] for row in rows]])
+            self.env.cr.commit()
+            _logger.debug("GatewayAPI DLR queue: applied %s delivery reports", len(rows))
+            if len(rows) < batch_size:
+                break
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from odoo import api, fields, models
+
+from ..tools import gatewayapi_logging, gatewayapi_metrics
+
+_logger = gatewayapi_logging.get_logger(gatewayapi_logging.DLR)
+
+DEFAULT_RETENTION_DAYS = 90
+GC_BATCH_SIZE = 10000
+DEFAULT_RECONCILE_AFTER_MINUTES = 30
+DEFAULT_RECONCILE_MAX_AGE_HOURS = 72
+# Messages polled per reconciliation run, and at most that many at once
+RECONCILE_BATCH_SIZE = 500
+RECONCILE_CONCURRENCY = 8
+
+
+def _fetch_gatewayapi_message_status(client, message_id):
+    """GET /rest/mtsms/{id}. Returns ``(response content, error)``, the
+    content being None when GatewayAPI no longer knows the message."""
+    try:
+        response = client.get(f'/rest/mtsms/{message_id}', endpoint='/rest/mtsms/{id}')
+        if response.status_code == 404:
+            return None, None
+        response.raise_for_status()
+        return response.json(), None
+    except Exception as e:
+        return None, e
+
+
+def _message_status_reports(message_id, content):
+    """Delivery report tuples, as taken by
+    ``sms.sms._gatewayapi_apply_delivery_reports``, from the recipients of
+    a /rest/mtsms/{id} answer. Recipients without a status yet are left
+    out."""
+    reports = []
+    for recipient in (content or {}).get('recipients') or []:
+        status = recipient.get('dsnstatus') or recipient.get('status')
+        if not status:
+            continue
+        timestamp = recipient.get('dsntime') or recipient.get('time')
+        reports.append((
+            message_id, status, recipient.get('dsnerror') or recipient.get('error'),
+            timestamp if isinstance(timestamp, (int, float)) else None, recipient.get('msisdn'),
+        ))
+    return reports
+
+
+class GatewayApiMessageLookup(models.Model):
+    """GatewayAPI message id and msisdn of every accepted recipient, mapped
+    to its ``sms.sms`` and ``sms.tracker`` to resolve delivery reports. The
+    table is created by :meth:`init`: the ORM has no 64-bit integer field."""
+    _name = "gatewayapi.message.lookup"
+    _description = "GatewayAPI Message Lookup"
+    _auto = False
+    _log_access = False
+    _order = "id"
+
+    message_id = fields.Integer(string="GatewayAPI Message ID", readonly=True)
+    msisdn = fields.Integer(string="MSISDN", readonly=True)
+    sms_id = fields.Many2one('sms.sms', string="SMS", readonly=True)
+    sms_tracker_id = fields.Many2one('sms.tracker', string="SMS Tracker", readonly=True)
+    account_id = fields.Many2one('iap.account', string="Sending Account", readonly=True)
+    sent_at = fields.Datetime(readonly=True)
+    status = fields.Char(string="Final Status", readonly=True)
+    checked_at = fields.Datetime(
+        readonly=True,
+        help="Last time the status of the message was polled from GatewayAPI."
+    )
+
+    def init(self):
+        self.env.cr.execute("""
+            CREATE TABLE IF NOT EXISTS gatewayapi_message_lookup (
+                id bigserial PRIMARY KEY,
+                message_id bigint NOT NULL,
+                msisdn bigint,
+                sms_id integer,
+                sms_tracker_id integer,
+                sent_at timestamp without time zone NOT NULL DEFAULT (now() at time zone 'UTC'),
+                status varchar,
+                checked_at timestamp without time zone
+            )
+        """)
+        self.env.cr.execute("ALTER TABLE gatewayapi_message_lookup ADD COLUMN IF NOT EXISTS account_id integer")
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS gatewayapi_message_lookup_message_id_msisdn_index
+                ON gatewayapi_message_lookup (message_id, msisdn)
+        """)
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS gatewayapi_message_lookup_sent_at_index
+                ON gatewayapi_message_lookup (sent_at)
+        """)
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS gatewayapi_message_lookup_pending_index
+                ON gatewayapi_message_lookup (sent_at) WHERE status IS NULL
+        """)
+
+    @api.model
+    def _register(self, rows, account_id=None):
+        """Record messages sent through ``account_id`` with a single INSERT,
+        bypassing the ORM.
+
+        :param rows: ``(message id, msisdn, sms id, sms uuid)`` tuples; the
+            tracker is found from the uuid
+        """
+        if not rows:
+            return
+        message_ids, msisdns, sms_ids, sms_uuids = zip(*rows)
+        self.env.cr.execute(
+            """INSERT INTO gatewayapi_message_lookup (message_id, msisdn, sms_id, sms_tracker_id, account_id)
+               SELECT v.message_id, v.msisdn, v.sms_id, t.id, %s
+                 FROM unnest(%s::bigint[], %s::bigint[], %s::integer[], %s::varchar[])
+                      AS v(message_id, msisdn, sms_id, sms_uuid)
+                 LEFT JOIN sms_tracker t ON t.sms_uuid = v.sms_uuid""",
+            [account_id, list(message_ids), list(msisdns), list(sms_ids), list(sms_uuids)],
+        )
+
+    @api.model
+    def _resolve(self, message_ids):
+        """Rows of the given GatewayAPI message ids, with the current state
+        of their ``sms.sms`` (None once it has been deleted).
+
+        :return: ``{message id: [(msisdn, lookup id, sms id, tracker id,
+            state, failure type, sent at)]}``
+        """
+        result = {}
+        if not message_ids:
+            return result
+        self.env.cr.execute(
+            """SELECT l.message_id, l.msisdn, l.id, s.id, l.sms_tracker_id, s.state, s.failure_type, l.sent_at
+                 FROM gatewayapi_message_lookup l
+                 LEFT JOIN sms_sms s ON s.id = l.sms_id
+                WHERE l.message_id = ANY(%s::bigint[])""",
+            [list(message_ids)],
+        )
+        for message_id, msisdn, *row in self.env.cr.fetchall():
+            result.setdefault(message_id, []).append((str(msisdn) if msisdn else None, *row))
+        return result
+
+    @api.model
+    def _mark_final(self, ids_by_status):
+        """Store the final delivery status of rows, ``{status: [lookup ids]}``."""
+        for status, lookup_ids in ids_by_status.items():
+            self.env.cr.execute(
+                "UPDATE gatewayapi_message_lookup SET status = %s WHERE id = ANY(%s)",
+                [status, lookup_ids],
+            )
+
+    @api.model
+    def _cron_reconcile(self, batch_size=RECONCILE_BATCH_SIZE):
+        """Poll GatewayAPI for the messages still without a final delivery
+        report some time after sending, least recently polled first, and
+        apply the statuses found. Each message is polled through the account
+        that sent it, or the current sending account for rows that have none."""
+        ICP = self.env['ir.config_parameter'].sudo()
+        after = int(ICP.get_param('gatewayapi.reconcile_after_minutes', DEFAULT_RECONCILE_AFTER_MINUTES) or 0)
+        max_age = int(ICP.get_param('gatewayapi.reconcile_max_age_hours', DEFAULT_RECONCILE_MAX_AGE_HOURS) or 0)
+        if after <= 0 or max_age <= 0:
+            return
+        now = fields.Datetime.now()
+        due = now - timedelta(minutes=after)
+        self.env.cr.execute(
+            """SELECT message_id, account_id
+                 FROM gatewayapi_message_lookup
+                WHERE status IS NULL
+                  AND sent_at BETWEEN %s AND %s
+                  AND (checked_at IS NULL OR checked_at < %s)
+                GROUP BY message_id, account_id
+                ORDER BY MAX(checked_at) NULLS FIRST, MIN(sent_at)
+                LIMIT %s""",
+            [now - timedelta(hours=max_age), due, due, batch_size],
+        )
+        rows = self.env.cr.fetchall()
+        if not rows:
+            return
+        message_ids = [message_id for message_id, _account_id in rows]
+
+        IapAccount = self.env['iap.account'].sudo()
+        accounts = IapAccount.browse({account_id for _message_id, account_id in rows if account_id}).exists()
+        clients = {
+            account.id: account._get_gatewayapi_client()
+            for account in accounts if account.gatewayapi_base_url and account.gatewayapi_api_token
+        }
+        default_account = IapAccount._get_gatewayapi_sms_account()
+        if default_account:
+            clients[None] = default_account._get_gatewayapi_client()
+        # Messages of deleted or unconfigured accounts cannot be polled
+        polled = [(message_id, clients[account_id]) for message_id, account_id in rows if account_id in clients]
+        with ThreadPoolExecutor(max_workers=max(min(len(polled), RECONCILE_CONCURRENCY), 1),
+                                thread_name_prefix='gatewayapi_reconcile') as executor:
+            outcomes = list(executor.map(
+                lambda job: _fetch_gatewayapi_message_status(job[1], job[0]), polled,
+            ))
+        reports, errors = [], len(rows) - len(polled)
+        for (message_id, _client), (content, error) in zip(polled, outcomes):
+            if error is not None:
+                errors += 1
+                _logger.debug("GatewayAPI reconcile: status of message %s failed: %s", message_id, error)
+                continue
+            reports += _message_status_reports(message_id, content)
+        self.env.cr.execute(
+            "UPDATE gatewayapi_message_lookup SET checked_at = %s WHERE message_id = ANY(%s::bigint[])",
+            [now, message_ids],
+        )
+        self.env['sms.sms'].sudo()._gatewayapi_apply_delivery_reports(reports)
+        for report in reports:
+            gatewayapi_metrics.DLR_RECONCILED.inc(status=report[1])
+        _logger.info("GatewayAPI reconcile: polled %s messages, %s reports applied, %s failed",
+                     len(message_ids), len(reports), errors)
+        cron = self.env.ref('gatewayapi_sms.ir_cron_reconcile_dlr', raise_if_not_found=False)
+        if cron and len(message_ids) == batch_size and errors < len(message_ids):
+            cron._trigger()
+
+    @api.model
+    def _cron_gc(self, batch_size=GC_BATCH_SIZE):
+        """Delete the rows older than the retention period, one batch per
+        transaction, oldest first."""
+        retention_days = int(self.env['ir.config_parameter'].sudo().get_param(
+            'gatewayapi.message_lookup_retention_days', DEFAULT_RETENTION_DAYS
+        ) or 0)
+        if retention_days <= 0:
+            return
+        cutoff = fields.Datetime.subtract(fields.Datetime.now(), days=retention_days)
+        deleted = 0
+        while True:
+            self.env.cr.execute(
+                """DELETE FROM gatewayapi_message_lookup
+                    WHERE id IN (SELECT id FROM gatewayapi_message_lookup
+                                  WHERE sent_at < %s
+                                  ORDER BY sent_at
+                                  LIMIT %s)""",
+                [cutoff, batch_size],
+            )
+            count = self.env.cr.rowcount
+            self.env.cr.commit()
+            deleted += count
+            if count < batch_size:
+                break
+        if deleted:
+            _logger.info("GatewayAPI message lookup: deleted %s rows sent before %s", deleted, cutoff)
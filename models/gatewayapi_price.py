@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+from odoo import fields, models
+
+
+class GatewayApiPrice(models.Model):
+    _name = "gatewayapi.price"
+    _description = "GatewayAPI SMS Price per Country Prefix"
+    _order = "account_id, prefix"
+
+    account_id = fields.Many2one(
+        'iap.account',
+        string="IAP Account",
+        required=True,
+        ondelete='cascade',
+        index=True,
+    )
+    prefix = fields.Char(
+        required=True,
+        help="Country calling code or longer number prefix, digits only (e.g. 45 for Denmark). "
+             "The longest matching prefix of a recipient number is used."
+    )
+    name = fields.Char(string="Country")
+    price = fields.Float(
+        string="Price per Segment",
+        digits=(16, 6),
+        help="Price of one SMS segment, in the currency of the account."
+    )
+
+    _sql_constraints = [
+        ('account_prefix_uniq', 'unique(account_id, prefix)', 'A prefix can only be priced once per account.'),
+    ]
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, fields, models
+
+from ..tools import gatewayapi_logging
+
+_logger = gatewayapi_logging.get_logger(gatewayapi_logging.SEND)
+
+MESSAGES = 'messages'
+REQUESTS = 'requests'
+BULK_MESSAGES = 'bulk_messages'
+
+
+class GatewayApiRateBucket(models.Model):
+    """Token buckets shared by every Odoo worker sending through an account.
+
+    A bucket holds up to ``rate * burst`` tokens and refills continuously at
+    ``rate`` tokens per second. Acquiring always takes the tokens, letting the
+    bucket go negative: the deficit is the backlog of work already admitted,
+    and its caller waits until the refill has paid it back. Concurrent
+    senders are thus spaced out at the configured rate instead of bursting.
+    A caller may also take tokens from a bucket without waiting on it, down
+    to a floor, to account for work another bucket admitted.
+
+    Buckets are updated in their own short transaction, so a long send
+    transaction never holds the row lock of another worker.
+    """
+    _name = "gatewayapi.rate.bucket"
+    _description = "GatewayAPI Rate Limit Bucket"
+    _log_access = False
+
+    account_id = fields.Many2one(
+        'iap.account',
+        required=True,
+        ondelete='cascade',
+        readonly=True,
+    )
+    kind = fields.Selection([
+        (MESSAGES, "Messages"),
+        (REQUESTS, "Requests"),
+        (BULK_MESSAGES, "Non-transactional Messages"),
+    ], required=True, readonly=True)
+    tokens = fields.Float(readonly=True)
+    updated_at = fields.Float(
+        readonly=True,
+        help="Database clock (epoch seconds) of the last refill."
+    )
+
+    _sql_constraints = [
+        ('account_kind_uniq', 'unique(account_id, kind)', 'Only one rate bucket per account and kind.'),
+    ]
+
+    @api.model
+    def _acquire(self, account_id, costs, max_wait):
+        """Take tokens from the buckets of ``account_id``.
+
+        :param costs: ``{kind: (tokens, rate, capacity, floor, wait)}``;
+            the bucket never goes below ``floor`` (None for no floor) and is
+            only waited on when ``wait`` is set. Unlimited kinds (rate 0)
+            must be left out
+        :param max_wait: longest acceptable wait in seconds
+        :return: seconds to wait before sending, or None when the wait would
+            exceed ``max_wait``; the tokens are given back in that case
+        """
+        if not costs:
+            return 0.0
+        wait = 0.0
+        with self.env.registry.cursor() as cr:
+            for kind, (cost, rate, capacity, floor, blocking) in sorted(costs.items()):
+                cr.execute(
+                    """INSERT INTO gatewayapi_rate_bucket (account_id, kind, tokens, updated_at)
+                       VALUES (%s, %s, %s, EXTRACT(EPOCH FROM clock_timestamp()))
+                       ON CONFLICT (account_id, kind) DO NOTHING""",
+                    [account_id, kind, capacity],
+                )
+                cr.execute(
+                    """UPDATE gatewayapi_rate_bucket
+                          SET tokens = GREATEST(LEAST(%(capacity)s, tokens + GREATEST(
+                                  EXTRACT(EPOCH FROM clock_timestamp()) - updated_at, 0) * %(rate)s
+                              ) - %(cost)s, %(floor)s),
+                              updated_at = EXTRACT(EPOCH FROM clock_timestamp())
+                        WHERE account_id = %(account_id)s AND kind = %(kind)s
+                    RETURNING tokens""",
+                    {'account_id': account_id, 'kind': kind, 'cost': cost, 'rate': rate, 'capacity': capacity,
+                     'floor': floor},
+                )
+                tokens = cr.fetchone()[0]
+                if blocking:
+                    wait = max(wait, -tokens / rate)
+            if wait > max_wait:
+                # Too far behind: give the tokens back, the caller keeps the
+                # work queued for a later run.
+                cr.rollback()
+                return None
+        if wait:
+            _logger.debug("GatewayAPI account %s: rate limited, waiting %.2fs", account_id, wait)
+        return max(wait, 0.0)
+
+    @api.model
+    def _get_backlog(self, account_ids, kind=MESSAGES):
+        """Current deficit of the ``kind`` buckets, i.e. the number of
+        messages (or requests) admitted but not yet allowed through.
+
+        :return: ``{account_id: backlog}``
+        """
+        if not account_ids:
+            return {}
+        self.env.cr.execute(
+            """SELECT b.account_id,
+                      b.tokens + GREATEST(EXTRACT(EPOCH FROM clock_timestamp()) - b.updated_at, 0) *
+                          CASE b.kind WHEN 'messages' THEN a.gatewayapi_rate_messages
+                                      WHEN 'requests' THEN a.gatewayapi_rate_requests
+                                      ELSE a.gatewayapi_rate_messages * (1 - a.gatewayapi_rate_reserved / 100) END
+                 FROM gatewayapi_rate_bucket b
+                 JOIN iap_account a ON a.id = b.account_id
+                WHERE b.account_id IN %s AND b.kind = %s""",
+            [tuple(account_ids), kind],
+        )
+        return {account_id: max(-tokens, 0.0) for account_id, tokens in self.env.cr.fetchall()}
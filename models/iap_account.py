@@ -1,13 +1,63 @@
 # -*- coding: utf-8 -*-
-from odoo import fields, models, api, _
+from odoo import fields, models, api, tools, _
 from datetime import datetime, timedelta
 from odoo.exceptions import ValidationError
+from odoo.tools import frozendict
+from concurrent.futures import ThreadPoolExecutor
 import pytz
 import logging
-import requests
+import re
+import time
+
+from ..tools import (
+    gatewayapi_batcher, gatewayapi_circuit, gatewayapi_client, gatewayapi_encoding, gatewayapi_logging,
+    gatewayapi_retry,
+)
 
 _logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.DEBUG)
+_balance_logger = gatewayapi_logging.get_logger(gatewayapi_logging.BALANCE)
+
+# account id -> monotonic time the balance refresh cron was last triggered for it
+_balance_refresh_requested = {}
+
+ESTIMATE_CHUNK_SIZE = 1000
+CREDIT_CHECK_CONCURRENCY = 8
+# Fields changing when the credit check of an account is next due
+CREDIT_CHECK_SCHEDULE_FIELDS = {
+    'gatewayapi_check_min_tokens', 'gatewayapi_cron_interval_number', 'gatewayapi_cron_interval_type',
+    'provider', 'service_name', 'gatewayapi_base_url', 'gatewayapi_api_token',
+}
+DEFAULT_BALANCE_TTL = 300
+BALANCE_FETCH_TIMEOUT = 60
+# Longest wait for the account row lock when updating the credit ledger
+CREDIT_LEDGER_LOCK_TIMEOUT = '5s'
+NON_DIGITS = re.compile(r'\D')
+# Fields the cached send configuration (_get_gatewayapi_send_config) depends on
+SEND_CONFIG_FIELDS = {
+    'provider', 'service_name', 'gatewayapi_base_url', 'gatewayapi_api_token', 'gatewayapi_sender',
+}
+
+
+def _fetch_gatewayapi_balance(account_id, client):
+    """GET /rest/me, sharing the call with any other in flight for the
+    account in this process. Returns ``(response content, error)`` so one
+    failing account does not abort the others checked concurrently."""
+    def fetch():
+        response = client.get('/rest/me')
+        response.raise_for_status()
+        return response.json()
+    try:
+        return gatewayapi_client.balance_flights.do(account_id, fetch, timeout=BALANCE_FETCH_TIMEOUT), None
+    except Exception as e:
+        return None, e
+
+
+def _match_price_prefix(number, price_table, prefix_lengths):
+    """Return the longest prefix of ``price_table`` matching ``number``, or None."""
+    digits = NON_DIGITS.sub('', str(number or ''))
+    if digits.startswith('00'):
+        digits = digits[2:]
+    return next((digits[:length] for length in prefix_lengths if digits[:length] in price_table), None)
 
 class IapAccount(models.Model):
     _name = "iap.account"
@@ -41,6 +91,125 @@ class IapAccount(models.Model):
         help="Sender name to use for outgoing SMS. This will appear as the sender on recipients' phones."
     )
     gatewayapi_api_token = fields.Char(help="GatewayAPI API Token")
+    gatewayapi_connect_timeout = fields.Float(
+        string="Connect Timeout (s)",
+        default=gatewayapi_client.DEFAULT_CONNECT_TIMEOUT,
+        help="Seconds to wait for a connection to GatewayAPI to be established."
+    )
+    gatewayapi_read_timeout = fields.Float(
+        string="Read Timeout (s)",
+        default=gatewayapi_client.DEFAULT_READ_TIMEOUT,
+        help="Seconds to wait for GatewayAPI to answer once connected."
+    )
+    gatewayapi_pool_size = fields.Integer(
+        string="Connection Pool Size",
+        default=gatewayapi_client.DEFAULT_POOL_SIZE,
+        help="Maximum number of keep-alive connections kept open to GatewayAPI per worker."
+    )
+    gatewayapi_max_concurrency = fields.Integer(
+        string="Concurrent Batches",
+        default=1,
+        help="Number of /rest/mtsms batches sent in parallel when flushing the SMS queue. "
+             "1 sends batches one after another. Keep it at or below the connection pool size."
+    )
+    gatewayapi_circuit_failure_threshold = fields.Integer(
+        string="Circuit Breaker Failures",
+        default=gatewayapi_circuit.DEFAULT_FAILURE_THRESHOLD,
+        help="Consecutive failed or slow calls to an endpoint after which calls to it fail fast. "
+             "SMS then stay in the queue instead of waiting for network timeouts."
+    )
+    gatewayapi_circuit_latency_threshold = fields.Float(
+        string="Circuit Breaker Slow Call (s)",
+        default=gatewayapi_circuit.DEFAULT_LATENCY_THRESHOLD,
+        help="Calls slower than this count as failures for the circuit breaker. 0 disables the check."
+    )
+    gatewayapi_circuit_cooldown = fields.Float(
+        string="Circuit Breaker Cooldown (s)",
+        default=gatewayapi_circuit.DEFAULT_COOLDOWN,
+        help="Time before a single probe call is let through an open circuit. "
+             "It doubles after every failed probe."
+    )
+    gatewayapi_retry_max_attempts = fields.Integer(
+        string="Attempts per Batch",
+        default=gatewayapi_retry.DEFAULT_MAX_ATTEMPTS,
+        help="Number of times a batch is sent when GatewayAPI cannot be reached or answers 429/503."
+    )
+    gatewayapi_retry_base_delay = fields.Float(
+        string="Retry Base Delay (s)",
+        default=gatewayapi_retry.DEFAULT_BASE_DELAY,
+        help="Initial backoff between attempts; it doubles on every attempt and is randomised (jitter)."
+    )
+    gatewayapi_retry_max_delay = fields.Float(
+        string="Retry Max Delay (s)",
+        default=gatewayapi_retry.DEFAULT_MAX_DELAY,
+        help="Longest wait between attempts. When GatewayAPI asks (Retry-After) for a longer pause, "
+             "the batch is postponed to a later queue run instead."
+    )
+    gatewayapi_retry_max_parks = fields.Integer(
+        string="Max Postponements",
+        default=gatewayapi_retry.DEFAULT_MAX_PARKS,
+        help="How many times an SMS is put back in the queue after all attempts failed, before it is "
+             "marked as failed."
+    )
+    gatewayapi_rate_messages = fields.Float(
+        string="Max Messages / Second",
+        help="Rate limit shared by all Odoo workers sending through this account. 0 means unlimited."
+    )
+    gatewayapi_rate_requests = fields.Float(
+        string="Max Requests / Second",
+        help="Limit on /rest/mtsms calls shared by all Odoo workers. 0 means unlimited."
+    )
+    gatewayapi_rate_reserved = fields.Float(
+        string="Reserved for Transactional (%)",
+        default=20.0,
+        help="Share of the message rate that normal and bulk SMS may not use, so transactional SMS "
+             "always find capacity."
+    )
+    gatewayapi_rate_burst = fields.Float(
+        string="Burst (s)",
+        default=1.0,
+        help="Seconds worth of unused rate that may be sent at once after an idle period."
+    )
+    gatewayapi_rate_max_wait = fields.Float(
+        string="Max Rate Wait (s)",
+        default=60.0,
+        help="Batches that would have to wait longer than this for the rate limit stay in the queue "
+             "for a later run."
+    )
+    gatewayapi_rate_backlog = fields.Float(
+        string="Rate Limit Queue",
+        compute='_compute_gatewayapi_rate_backlog',
+        help="Messages admitted by the rate limiter that are still waiting for their turn."
+    )
+    gatewayapi_bisect_max_calls = fields.Integer(
+        string="Bad Batch Isolation Calls",
+        default=16,
+        help="When GatewayAPI rejects a whole batch (HTTP 400/422), it is split in halves and sent again "
+             "to isolate the offending SMS, which fail with a number format error. This is the maximum "
+             "number of extra requests per rejected batch; 0 fails the whole batch."
+    )
+    gatewayapi_adaptive_batching = fields.Boolean(
+        string="Adaptive Batch Size",
+        default=True,
+        help="Grow or shrink the number of messages per request based on GatewayAPI response "
+             "time, request size and errors. When disabled, the batch size below is used as is."
+    )
+    gatewayapi_batch_size = fields.Integer(
+        string="Batch Size",
+        default=gatewayapi_batcher.DEFAULT_BATCH_SIZE,
+        help="Number of messages per /rest/mtsms request. With adaptive batching this is the "
+             "starting size; each Odoo worker then adapts its own size in memory."
+    )
+    gatewayapi_high_lane_batch_size = fields.Integer(
+        string="Transactional Batch Size",
+        default=10,
+        help="Maximum number of transactional SMS per request, kept small so they go out without delay."
+    )
+    gatewayapi_batch_size_max = fields.Integer(
+        string="Maximum Batch Size",
+        default=gatewayapi_batcher.MAX_BATCH_SIZE,
+        help="Upper bound for the batch size. GatewayAPI accepts up to 1000 messages per request."
+    )
     gatewayapi_check_min_tokens = fields.Boolean(
         string="Check for minimum credits",
         default=False,
@@ -71,10 +240,50 @@ class IapAccount(models.Model):
         copy=False,
         help="Timestamp of the last automated credit balance check for this account.",
     )
+    gatewayapi_next_credit_check = fields.Datetime(
+        string="Next Credit Check",
+        compute='_compute_gatewayapi_next_credit_check',
+        store=True,
+        index=True,
+        help="When the automated credit balance check of this account is next due."
+    )
     show_token = fields.Boolean(
         default=False,
         help="Show or hide the API token in the form."
     )
+    gatewayapi_price_ids = fields.One2many(
+        'gatewayapi.price',
+        'account_id',
+        string="Prices",
+        help="Local copy of the GatewayAPI price list, used to estimate campaign costs without calling the API."
+    )
+    gatewayapi_credit_guard = fields.Selection([
+        ('off', "Off"),
+        ('refuse', "Refuse batch"),
+        ('defer', "Keep in queue"),
+    ], string="Credit Guard", default='off', required=True,
+        help="Reserve the estimated cost of every batch on a local credit ledger before sending it. "
+             "When the ledger cannot cover a batch, either fail its SMS with a credit error or keep "
+             "them queued until the balance is refreshed."
+    )
+    gatewayapi_credit_available = fields.Float(
+        string="Available Credit (ledger)",
+        readonly=True,
+        copy=False,
+        help="Local credit ledger: last GatewayAPI balance minus the cost of the batches sent since."
+    )
+    gatewayapi_credit_synced_at = fields.Datetime(
+        string="Ledger Synced At",
+        readonly=True,
+        copy=False,
+        help="When the local credit ledger was last seeded from GatewayAPI."
+    )
+    gatewayapi_default_price = fields.Float(
+        string="Default Price per Segment",
+        digits=(16, 6),
+        help="Price used for recipients whose number matches no prefix of the price list. "
+             "Leave at 0 to report them as unpriced."
+    )
 
     @api.constrains('provider', 'name')
     def _check_gatewayapi_name_required(self):
@@ -104,14 +313,25 @@ class IapAccount(models.Model):
     ], string="Interval type", default="days", help="Unit for the credit check interval.")
     gatewayapi_balance = fields.Float(
         string="Balance",
-        compute="_compute_gatewayapi_balance",
-        store=False,
-        help="Current GatewayAPI credit balance."
+        readonly=True,
+        copy=False,
+        help="GatewayAPI credit balance, as of its last refresh."
     )
     gatewayapi_currency = fields.Char(
         string="Currency",
         help="Currency for GatewayAPI credit balance."
     )
+    gatewayapi_balance_fetched_at = fields.Datetime(
+        string="Balance Updated",
+        readonly=True,
+        copy=False,
+        help="When the balance was last fetched from GatewayAPI."
+    )
+    gatewayapi_balance_ttl = fields.Integer(
+        string="Balance Refresh (s)",
+        default=DEFAULT_BALANCE_TTL,
+        help="Age after which the stored balance is refreshed in the background when displayed."
+    )
     gatewayapi_balance_display = fields.Char(
         string="Balance",
         compute="_compute_gatewayapi_balance_display",
@@ -191,77 +411,441 @@ class IapAccount(models.Model):
         # If no GatewayAPI-specific account is found by the above criteria,
         # fall back to Odoo's standard IAP mechanism for the 'sms' service.
         # This might return an empty recordset or an account for a different provider.
-        _logger.info("No specifically configured GatewayAPI account found by _get_sms_account helper, falling back to self.get('sms').")
+        _logger.debug("No specifically configured GatewayAPI account found by _get_sms_account helper, falling back to self.get('sms').")
         return self.get("sms")
 
+    @api.model
+    @tools.ormcache()
+    def _get_gatewayapi_send_config(self):
+        """Resolve the account and settings used to send SMS, once per worker.
+
+        The result is kept in the registry cache. It is cleared when the
+        relevant fields of an account are created, written or unlinked, and
+        by any ``ir.config_parameter`` change (which clears the registry
+        cache), so ``web.base.url`` never goes stale.
+
+        Returns a frozendict, or None when no GatewayAPI account is configured.
+        """
+        account = self.sudo()._get_sms_account()
+        if not (account and account.gatewayapi_api_token and account.gatewayapi_base_url):
+            return None
+        web_base_url = (self.env['ir.config_parameter'].sudo().get_param('web.base.url', '') or '').rstrip('/')
+        return frozendict({
+            'account_id': account.id,
+            'sender': account.gatewayapi_sender or account.service_name or "Odoo",
+            'web_base_url': web_base_url,
+            'callback_url': f"{web_base_url}/gatewayapi/dlr" if web_base_url else False,
+        })
+
+    @api.model
+    def _get_gatewayapi_sms_account(self):
+        """Cached counterpart of ``_get_sms_account`` restricted to configured
+        GatewayAPI accounts; empty when there is none."""
+        config = self._get_gatewayapi_send_config()
+        return self.browse(config['account_id']) if config else self.browse()
+
     @api.model
     def check_gatewayapi_credit_balance(self):
-        accounts_to_check = self.env['iap.account'].search([
+        """Check the balance of the accounts whose credit check is due, all
+        at once, then trigger the cron again at the earliest next check."""
+        now = fields.Datetime.now()
+        accounts_to_check = self.env['iap.account'].search(self._gatewayapi_credit_check_domain() + [
+            '|',
+            ('gatewayapi_next_credit_check', '=', False),
+            ('gatewayapi_next_credit_check', '<=', now),
+        ])
+        _balance_logger.debug("Found %s GatewayAPI accounts due for a credit check.", len(accounts_to_check))
+        if accounts_to_check:
+            # Marked as checked up front, a failing account waits for its next interval
+            accounts_to_check.sudo().write({'gatewayapi_last_credit_check_time': now})
+            clients = [account._get_gatewayapi_client() for account in accounts_to_check]
+            max_workers = min(len(clients), CREDIT_CHECK_CONCURRENCY)
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gatewayapi_balance') as executor:
+                outcomes = list(executor.map(
+                    lambda account_client: _fetch_gatewayapi_balance(*account_client),
+                    zip(accounts_to_check.ids, clients),
+                ))
+            for account, (response_content, error) in zip(accounts_to_check, outcomes):
+                if error is not None:
+                    _balance_logger.warning("Account %s: Exception getting balance: %s", account.name, error)
+                    continue
+                if 'credit' not in response_content:
+                    _balance_logger.warning("Account %s: GatewayAPI error: %s", account.name,
+                                            response_content.get('error', 'Unknown error'))
+                    continue
+                account._gatewayapi_seed_credit_ledger(response_content['credit'])
+                account._gatewayapi_store_balance(response_content)
+                account._gatewayapi_notify_low_credit(response_content['credit'])
+        self._gatewayapi_schedule_credit_check()
+
+    def _gatewayapi_notify_low_credit(self, api_credits):
+        """Run the notification action when ``api_credits`` is below the minimum."""
+        self.ensure_one()
+        _balance_logger.debug("Account %s: Credit balance: %s", self.name, api_credits)
+        if self.gatewayapi_min_tokens < 0:
+            _balance_logger.info("Account %s: Min tokens invalid. Skipping.", self.name)
+            return
+        if not self.gatewayapi_token_notification_action:
+            _balance_logger.debug("Account %s: No action set. Skipping.", self.name)
+            return
+        if float(api_credits) < float(self.gatewayapi_min_tokens):
+            _balance_logger.info("Account %s: Low credit: %s < %s.", self.name, api_credits, self.gatewayapi_min_tokens)
+            ctx = {'active_id': self.id, 'active_model': 'iap.account'}
+            try:
+                self.gatewayapi_token_notification_action.with_context(ctx).run()
+                _balance_logger.info("Account %s: Notification action triggered.", self.name)
+            except Exception as e:
+                _balance_logger.error("Account %s: Failed to run action: %s", self.name, e)
+
+    @api.model
+    def _gatewayapi_credit_check_domain(self):
+        """Accounts the automated credit check applies to."""
+        return [
             ('service_name', '=', 'sms'),
             ('gatewayapi_check_min_tokens', '=', True),
             '|',
             ('provider', '=', 'sms_api_gatewayapi'),
             '&',
             ('gatewayapi_base_url', '!=', False),
-            ('gatewayapi_api_token', '!=', False)
-        ])
-        _logger.info(f"Found {len(accounts_to_check)} GatewayAPI accounts to potentially check.")
-        for account in accounts_to_check:
-            _logger.info(f"Checking account: {account.name} (ID: {account.id})")
-            now = fields.Datetime.now()
-            last_check_time = account.gatewayapi_last_credit_check_time
-            interval_number = account.gatewayapi_cron_interval_number
-            interval_type = account.gatewayapi_cron_interval_type
-            check_due = False
-            if not last_check_time:
-                check_due = True
-            else:
-                interval_delta = timedelta()
-                if interval_type == 'minutes': interval_delta = timedelta(minutes=interval_number)
-                elif interval_type == 'hours': interval_delta = timedelta(hours=interval_number)
-                elif interval_type == 'days': interval_delta = timedelta(days=interval_number)
-                elif interval_type == 'weeks': interval_delta = timedelta(weeks=interval_number)
-                next_check_time = last_check_time + interval_delta
-                if now >= next_check_time: check_due = True
-
-            if check_due:
-                _logger.info(f"Account {account.name}: Performing credit balance check.")
-                try:
-                    account.sudo().write({'gatewayapi_last_credit_check_time': now})
-                    api_credits = account.get_current_credit_balance()
-                except UserWarning as e:
-                    _logger.warning(f"Account {account.name}: GatewayAPI error: {e}")
-                except Exception as e:
-                    _logger.warning(f"Account {account.name}: Exception getting balance: {e}")
-                else:
-                    _logger.info(f"Account {account.name}: Credit balance: {api_credits}")
-                    if account.gatewayapi_min_tokens < 0:
-                        _logger.info(f"Account {account.name}: Min tokens invalid. Skipping.")
-                        continue
-                    if not account.gatewayapi_token_notification_action:
-                        _logger.info(f"Account {account.name}: No action set. Skipping.")
-                        continue
-                    if float(api_credits) < float(account.gatewayapi_min_tokens):
-                        _logger.info(f"Account {account.name}: Low credit: {api_credits} < {account.gatewayapi_min_tokens}.")
-                        ctx = {'active_id': account.id, 'active_model': 'iap.account'}
-                        try:
-                            account.gatewayapi_token_notification_action.with_context(ctx).run()
-                            _logger.info(f"Account {account.name}: Notification action triggered.")
-                        except Exception as e:
-                            _logger.error(f"Account {account.name}: Failed to run action: {e}")
+            ('gatewayapi_api_token', '!=', False),
+        ]
+
+    @api.model
+    def _gatewayapi_schedule_credit_check(self):
+        """Trigger the credit check cron at the earliest next check time."""
+        cron = self.env.ref('gatewayapi_sms.ir_cron_check_tokens', raise_if_not_found=False)
+        if not cron:
+            return
+        accounts = self.env['iap.account'].sudo().search(self._gatewayapi_credit_check_domain())
+        if not accounts:
+            return
+        now = fields.Datetime.now()
+        next_check = min(account.gatewayapi_next_credit_check or now for account in accounts)
+        cron.sudo()._trigger(at=max(next_check, now))
+
+    @api.depends('gatewayapi_check_min_tokens', 'gatewayapi_last_credit_check_time',
+                 'gatewayapi_cron_interval_number', 'gatewayapi_cron_interval_type')
+    def _compute_gatewayapi_next_credit_check(self):
+        for account in self:
+            if account.gatewayapi_check_min_tokens and account.gatewayapi_last_credit_check_time:
+                interval = timedelta(**{
+                    account.gatewayapi_cron_interval_type or 'days': max(account.gatewayapi_cron_interval_number, 1)
+                })
+                account.gatewayapi_next_credit_check = account.gatewayapi_last_credit_check_time + interval
             else:
-                _logger.info(f"Account {account.name}: Check not due.")
+                # Never checked: due right away
+                account.gatewayapi_next_credit_check = False
+
+    def _get_gatewayapi_client(self):
+        """Return the pooled, keep-alive HTTP client shared by all GatewayAPI calls of this account."""
+        self.ensure_one()
+        return gatewayapi_client.get_client(
+            self.id,
+            self.gatewayapi_base_url or gatewayapi_client.DEFAULT_BASE_URL,
+            self.gatewayapi_api_token,
+            connect_timeout=self.gatewayapi_connect_timeout,
+            read_timeout=self.gatewayapi_read_timeout,
+            pool_size=self.gatewayapi_pool_size,
+            circuit=(
+                self.gatewayapi_circuit_failure_threshold,
+                self.gatewayapi_circuit_latency_threshold,
+                self.gatewayapi_circuit_cooldown,
+            ),
+        )
+
+    def _get_gatewayapi_retry_policy(self):
+        self.ensure_one()
+        return gatewayapi_retry.RetryPolicy(
+            max_attempts=self.gatewayapi_retry_max_attempts,
+            base_delay=self.gatewayapi_retry_base_delay,
+            max_delay=self.gatewayapi_retry_max_delay,
+        )
+
+    def _gatewayapi_acquire_rate(self, message_count, lane='normal'):
+        """Reserve ``message_count`` messages and one request on the shared
+        rate limiter.
+
+        With a share reserved for transactional SMS, only the high lane waits
+        on the 'messages' bucket. The other lanes wait on 'bulk_messages',
+        refilled without the reserved share, and take from 'messages' no
+        further than empty, so they never leave a backlog transactional SMS
+        would queue behind. High lane messages are taken from
+        'bulk_messages' as well, without waiting on it, so that both lanes
+        together stay within the message rate.
+
+        Returns the number of seconds to wait before sending, or None when
+        the limiter is too far behind and the batch should stay queued.
+        """
+        self.ensure_one()
+        burst = max(self.gatewayapi_rate_burst, 0.0)
+        reserved = min(max(self.gatewayapi_rate_reserved, 0.0), 100.0) / 100
+        shared = lane != 'high' and reserved
+        costs = {}
+        for kind, rate, cost, floor, blocking in (
+            ('messages', self.gatewayapi_rate_messages, message_count, 0.0 if shared else None, not shared),
+            ('requests', self.gatewayapi_rate_requests, 1, None, True),
+            ('bulk_messages', self.gatewayapi_rate_messages * (1 - reserved) if reserved else 0,
+             message_count, None, bool(shared)),
+        ):
+            if rate > 0:
+                costs[kind] = (cost, rate, max(rate * burst, 1.0), floor, blocking)
+        return self.env['gatewayapi.rate.bucket'].sudo()._acquire(
+            self.id, costs, self.gatewayapi_rate_max_wait
+        )
+
+    def _compute_gatewayapi_rate_backlog(self):
+        RateBucket = self.env['gatewayapi.rate.bucket'].sudo()
+        backlog = RateBucket._get_backlog(self.ids)
+        bulk_backlog = RateBucket._get_backlog(self.ids, 'bulk_messages')
+        for account in self:
+            account.gatewayapi_rate_backlog = max(backlog.get(account.id, 0.0), bulk_backlog.get(account.id, 0.0))
+
+    def _get_gatewayapi_batch_sizer(self, lane='normal'):
+        """Adaptive sizer of ``lane``; bulk batches have their own, starting
+        at the maximum batch size."""
+        self.ensure_one()
+        if lane == 'bulk':
+            return gatewayapi_batcher.get_sizer(
+                (self.id, lane), size=self.gatewayapi_batch_size_max, max_size=self.gatewayapi_batch_size_max
+            )
+        return gatewayapi_batcher.get_sizer(
+            self.id, size=self.gatewayapi_batch_size, max_size=self.gatewayapi_batch_size_max
+        )
+
+    def _get_gatewayapi_batch_size(self, lane='normal'):
+        """Number of messages to put in the next /rest/mtsms request of ``lane``."""
+        self.ensure_one()
+        max_size = min(self.gatewayapi_batch_size_max or gatewayapi_batcher.MAX_BATCH_SIZE,
+                       gatewayapi_batcher.MAX_BATCH_SIZE)
+        if self.gatewayapi_adaptive_batching:
+            size = self._get_gatewayapi_batch_sizer('bulk' if lane == 'bulk' else 'normal').size
+        elif lane == 'bulk':
+            size = max_size
+        else:
+            size = min(self.gatewayapi_batch_size or gatewayapi_batcher.DEFAULT_BATCH_SIZE, max_size)
+        if lane == 'high':
+            size = min(size, self.gatewayapi_high_lane_batch_size or size)
+        return max(size, 1)
+
+    def _get_gatewayapi_price_table(self):
+        """Return ``{prefix: price per segment}`` for this account."""
+        self.ensure_one()
+        return {price.prefix: price.price for price in self.sudo().gatewayapi_price_ids}
+
+    def _gatewayapi_estimate_cost(self, sms_ids, chunk_size=ESTIMATE_CHUNK_SIZE):
+        """Estimate segments and cost of sending the ``sms.sms`` of ``sms_ids``,
+        without any call to GatewayAPI. Access to the SMS is not checked, see
+        ``sms.sms.gatewayapi_estimate_cost``.
+
+        Bodies and numbers are read in chunks of ``chunk_size`` rows so memory
+        stays bounded however large the campaign is. Prices come from the account's local price list,
+        matched on the longest prefix of each recipient number.
+
+        Returns a dict of aggregates::
+
+            {
+                'count': int, 'segments': int, 'cost': float, 'currency': str,
+                'unpriced_count': int,
+                'by_encoding': {'GSM7': {'count': int, 'segments': int}, 'UCS2': {...}},
+                'by_prefix': {'45': {'count': int, 'segments': int, 'cost': float}, ...},
+            }
+        """
+        self.ensure_one()
+        price_table = self._get_gatewayapi_price_table()
+        prefix_lengths = sorted({len(prefix) for prefix in price_table}, reverse=True)
+
+        estimate = {
+            'count': 0,
+            'segments': 0,
+            'cost': 0.0,
+            'currency': self.gatewayapi_currency or '',
+            'unpriced_count': 0,
+            'by_encoding': {},
+            'by_prefix': {},
+        }
+        self.env['sms.sms'].flush_model(['number', 'body'])
+        for offset in range(0, len(sms_ids), chunk_size):
+            # Plain SQL keeps the bodies out of the ORM cache
+            self.env.cr.execute(
+                "SELECT number, body FROM sms_sms WHERE id = ANY(%s)",
+                [list(sms_ids[offset:offset + chunk_size])],
+            )
+            rows = self.env.cr.fetchall()
+            classified = gatewayapi_encoding.classify_many(body for __, body in rows)
+            for number, body in rows:
+                encoding, __, segments = classified[body]
+                prefix = _match_price_prefix(number, price_table, prefix_lengths)
+                price = price_table[prefix] if prefix else self.gatewayapi_default_price
+                cost = price * segments
+
+                estimate['count'] += 1
+                estimate['segments'] += segments
+                estimate['cost'] += cost
+                if not prefix and not self.gatewayapi_default_price:
+                    estimate['unpriced_count'] += 1
+                by_encoding = estimate['by_encoding'].setdefault(encoding, {'count': 0, 'segments': 0})
+                by_encoding['count'] += 1
+                by_encoding['segments'] += segments
+                by_prefix = estimate['by_prefix'].setdefault(prefix or '', {'count': 0, 'segments': 0, 'cost': 0.0})
+                by_prefix['count'] += 1
+                by_prefix['segments'] += segments
+                by_prefix['cost'] += cost
+        return estimate
+
+    def _gatewayapi_estimate_payload_cost(self, batch_payload_items):
+        """Estimated cost of a /rest/mtsms payload, from the local price list."""
+        self.ensure_one()
+        price_table = self._get_gatewayapi_price_table()
+        prefix_lengths = sorted({len(prefix) for prefix in price_table}, reverse=True)
+        cost = 0.0
+        for item in batch_payload_items:
+            segments = gatewayapi_encoding.count_segments(item['message'])
+            for recipient in item['recipients']:
+                prefix = _match_price_prefix(recipient['msisdn'], price_table, prefix_lengths)
+                cost += segments * (price_table[prefix] if prefix else self.gatewayapi_default_price)
+        return cost
+
+    def _gatewayapi_seed_credit_ledger(self, credit):
+        """Reset the local credit ledger to the balance reported by /rest/me."""
+        self.ensure_one()
+        self.env.cr.execute(
+            """UPDATE iap_account
+                  SET gatewayapi_credit_available = %s,
+                      gatewayapi_credit_synced_at = (now() at time zone 'UTC')
+                WHERE id = %s""",
+            [float(credit), self.id],
+        )
+        self.invalidate_recordset(['gatewayapi_credit_available', 'gatewayapi_credit_synced_at'])
+
+    def _gatewayapi_reserve_credit(self, amount):
+        """Atomically take ``amount`` from the local credit ledger.
+
+        Returns False when the ledger cannot cover it. Always succeeds when the
+        credit guard is off or the ledger was never seeded. The ledger is
+        updated in its own short transaction, so the account row is not kept
+        locked while the batch is sent.
+        """
+        self.ensure_one()
+        if self.gatewayapi_credit_guard == 'off' or not self.gatewayapi_credit_synced_at or not amount:
+            return True
+        with self.env.registry.cursor() as cr:
+            cr.execute("SET LOCAL lock_timeout = %s", [CREDIT_LEDGER_LOCK_TIMEOUT])
+            cr.execute(
+                """UPDATE iap_account
+                      SET gatewayapi_credit_available = gatewayapi_credit_available - %s
+                    WHERE id = %s AND gatewayapi_credit_available >= %s
+                RETURNING id""",
+                [amount, self.id, amount],
+            )
+            reserved = bool(cr.fetchone())
+        self.invalidate_recordset(['gatewayapi_credit_available'])
+        return reserved
+
+    def _gatewayapi_settle_credit(self, reserved, response_content):
+        """Reconcile a reservation with the cost GatewayAPI reported in the
+        ``usage`` part of a /rest/mtsms response. A batch that got no usage
+        back (e.g. the request failed) has its reservation released.
+
+        Runs in its own transaction and never raises: a ledger error must
+        not roll back the sends being recorded, the next balance check
+        reseeds the ledger anyway."""
+        self.ensure_one()
+        if self.gatewayapi_credit_guard == 'off' or not self.gatewayapi_credit_synced_at:
+            return
+        usage = (response_content or {}).get('usage') or {}
+        try:
+            actual = float(usage['total_cost'])
+        except (KeyError, TypeError, ValueError):
+            actual = reserved if response_content else 0.0
+        if actual == reserved:
+            return
+        try:
+            with self.env.registry.cursor() as cr:
+                cr.execute("SET LOCAL lock_timeout = %s", [CREDIT_LEDGER_LOCK_TIMEOUT])
+                cr.execute(
+                    """UPDATE iap_account
+                          SET gatewayapi_credit_available = gatewayapi_credit_available + %s
+                        WHERE id = %s""",
+                    [reserved - actual, self.id],
+                )
+        except Exception:
+            _logger.warning("GatewayAPI account %s: could not settle the credit ledger (%s reserved, %s used)",
+                            self.id, reserved, actual, exc_info=True)
+            return
+        self.invalidate_recordset(['gatewayapi_credit_available'])
+
+    def _gatewayapi_balance_is_stale(self):
+        self.ensure_one()
+        if not (self.gatewayapi_base_url and self.gatewayapi_api_token):
+            return False
+        ttl = timedelta(seconds=self.gatewayapi_balance_ttl or DEFAULT_BALANCE_TTL)
+        return not self.gatewayapi_balance_fetched_at or fields.Datetime.now() - self.gatewayapi_balance_fetched_at > ttl
+
+    def _gatewayapi_request_balance_refresh(self):
+        """Trigger the balance refresh cron for the accounts of ``self``, at
+        most once per balance TTL and account in this process."""
+        now = time.monotonic()
+        due = [
+            account for account in self
+            if now - _balance_refresh_requested.get(account.id, float('-inf'))
+            > (account.gatewayapi_balance_ttl or DEFAULT_BALANCE_TTL)
+        ]
+        if not due:
+            return
+        cron = self.env.ref('gatewayapi_sms.ir_cron_refresh_balance', raise_if_not_found=False)
+        if cron:
+            _balance_refresh_requested.update(dict.fromkeys((account.id for account in due), now))
+            cron.sudo()._trigger()
+
+    def _gatewayapi_refresh_balance(self):
+        """Fetch the balance from GatewayAPI and store it as the account's
+        snapshot. Concurrent refreshes of an account within this process
+        share one in-flight request. Returns the /rest/me response."""
+        self.ensure_one()
+        response_content = self.get_current_credit_balance(full_response=True)
+        self._gatewayapi_store_balance(response_content)
+        return response_content
+
+    def _gatewayapi_store_balance(self, response_content):
+        """Store a /rest/me response as the balance snapshot."""
+        self.ensure_one()
+        # Raw SQL: the write() override runs notification action logic that a
+        # snapshot update does not need.
+        self.env.cr.execute(
+            """UPDATE iap_account
+                  SET gatewayapi_balance = %s,
+                      gatewayapi_currency = %s,
+                      gatewayapi_balance_fetched_at = (now() at time zone 'UTC')
+                WHERE id = %s""",
+            [float(response_content.get('credit', 0.0)), response_content.get('currency', ''), self.id],
+        )
+        self.invalidate_recordset(['gatewayapi_balance', 'gatewayapi_currency', 'gatewayapi_balance_fetched_at'])
+
+    @api.model
+    def _cron_refresh_gatewayapi_balances(self):
+        """Refresh the balance snapshots older than their TTL."""
+        accounts = self.search([('gatewayapi_base_url', '!=', False), ('gatewayapi_api_token', '!=', False)])
+        for account in accounts.filtered(lambda account: account._gatewayapi_balance_is_stale()):
+            try:
+                account._gatewayapi_refresh_balance()
+            except Exception as e:
+                _balance_logger.warning("Account %s: could not refresh balance: %s", account.name, e)
+
+    def action_gatewayapi_refresh_balance(self):
+        for account in self:
+            account._gatewayapi_refresh_balance()
+        return {'type': 'ir.actions.client', 'tag': 'reload'}
 
     def get_current_credit_balance(self, full_response=False):
         self.ensure_one()
-        headers = {'Authorization': (f'Token {self.gatewayapi_api_token}')}
         base_url = self.gatewayapi_base_url or 'https://gatewayapi.eu'
         if not (base_url.startswith('http://') or base_url.startswith('https://')):
             raise UserWarning('GatewayAPI Base URL must start with http:// or https://')
-        url = base_url.rstrip('/') + '/rest/me'
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        response_content = response.json()
+        response_content, error = _fetch_gatewayapi_balance(self.id, self._get_gatewayapi_client())
+        if error is not None:
+            raise error
+        if 'credit' in response_content:
+            self._gatewayapi_seed_credit_ledger(response_content['credit'])
         if full_response: return response_content
         if 'credit' in response_content: return response_content['credit']
         raise UserWarning(response_content.get('error', 'Unknown error'))
@@ -272,18 +856,19 @@ class IapAccount(models.Model):
             self.gatewayapi_connection_status = "Not a GatewayAPI configured account or no base URL."
             return {'type': 'ir.actions.client', 'tag': 'reload'}
         try:
-            full_info = iap_account.get_current_credit_balance(full_response=True)
-            iap_account.gatewayapi_balance = float(full_info.get('credit', 0.0))
-            iap_account.gatewayapi_currency = full_info.get('currency', '')
+            iap_account._gatewayapi_refresh_balance()
             iap_account.gatewayapi_connection_status = "OK"
-            _logger.info("GatewayAPI connection test successful")
+            _balance_logger.info("GatewayAPI connection test successful")
+        except gatewayapi_circuit.CircuitOpenError as e:
+            _balance_logger.warning("GatewayAPI connection test skipped: %s", e)
+            iap_account.gatewayapi_connection_status = str(e)
         except UserWarning as e:
-            _logger.warning(f"GatewayAPI connection test error: {e}")
+            _balance_logger.warning("GatewayAPI connection test error: %s", e)
             iap_account.gatewayapi_connection_status = str(e)
             iap_account.gatewayapi_balance = 0.0
             iap_account.gatewayapi_currency = ''
         except Exception as e:
-            _logger.exception("GatewayAPI connection test exception")
+            _balance_logger.exception("GatewayAPI connection test exception")
             iap_account.gatewayapi_connection_status = _("Unexpected error. Check server log.")
             iap_account.gatewayapi_balance = 0.0
             iap_account.gatewayapi_currency = ''
@@ -332,6 +917,9 @@ class IapAccount(models.Model):
             processed_vals_list.append(vals_item)
 
         records = super(IapAccount, self).create(processed_vals_list)
+        self.env.registry.clear_cache()
+        if any(record.gatewayapi_check_min_tokens for record in records):
+            self._gatewayapi_schedule_credit_check()
 
         # Post-create logic to ensure server action is correctly set
         if notification_action: # Check if action exists
@@ -365,6 +953,10 @@ class IapAccount(models.Model):
             _logger.info("Credit checks disabled. Clearing notification action.")
 
         res = super(IapAccount, self).write(vals)
+        if SEND_CONFIG_FIELDS.intersection(vals):
+            self.env.registry.clear_cache()
+        if CREDIT_CHECK_SCHEDULE_FIELDS.intersection(vals):
+            self._gatewayapi_schedule_credit_check()
 
         # Get the notification action reference
         notification_action = self.env.ref('gatewayapi_sms.low_credits_notification_action', raise_if_not_found=False)
@@ -399,22 +991,14 @@ class IapAccount(models.Model):
 
         return res
 
-    @api.depends('gatewayapi_api_token', 'gatewayapi_base_url')
-    def _compute_gatewayapi_balance(self):
-        for rec in self:
-            if rec.gatewayapi_base_url and rec.gatewayapi_api_token:
-                try:
-                    response = rec.get_current_credit_balance(full_response=True)
-                    rec.gatewayapi_balance = float(response.get('credit', 0.0))
-                    rec.gatewayapi_currency = response.get('currency', '')
-                except Exception:
-                    rec.gatewayapi_balance = 0.0
-                    rec.gatewayapi_currency = ''
-            else:
-                rec.gatewayapi_balance = 0.0
-                rec.gatewayapi_currency = ''
+    def unlink(self):
+        res = super(IapAccount, self).unlink()
+        self.env.registry.clear_cache()
+        return res
 
     def _compute_gatewayapi_balance_display(self):
+        # Only the stored snapshot is read here, stale ones are refreshed by the cron
+        self.filtered(lambda rec: rec._gatewayapi_balance_is_stale())._gatewayapi_request_balance_refresh()
         for rec in self:
             if rec.gatewayapi_base_url and rec.gatewayapi_api_token:
                 if rec.gatewayapi_currency:
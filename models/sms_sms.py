@@ -1,13 +1,123 @@
 # -*- coding: utf-8 -*-
 
-from odoo import fields, models, tools
-import logging
+from odoo import _, api, fields, models
+from odoo.exceptions import UserError
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import itertools
+import json
 import requests
-import re
-
-_logger = logging.getLogger(__name__)
-_logger.setLevel(logging.DEBUG)
-logging.basicConfig(level=logging.DEBUG)
+import threading
+import time
+
+from ..tools import (
+    gatewayapi_circuit, gatewayapi_encoding, gatewayapi_logging, gatewayapi_metrics, gatewayapi_retry,
+)
+from .iap_account import DEFAULT_BALANCE_TTL
+
+_logger = gatewayapi_logging.get_logger(gatewayapi_logging.SEND)
+_dlr_logger = gatewayapi_logging.get_logger(gatewayapi_logging.DLR)
+_send_summary = gatewayapi_logging.LogSummary(_logger, "GatewayAPI send")
+_dlr_summary = gatewayapi_logging.LogSummary(_dlr_logger, "GatewayAPI delivery reports")
+
+# Sending lanes, highest priority first
+GATEWAYAPI_LANES = ('high', 'normal', 'bulk')
+
+# Outgoing SMS read per chunk by the queue processing
+QUEUE_CHUNK_SIZE = 1000
+# HTTP statuses meaning GatewayAPI refused the content of a request
+GATEWAYAPI_PAYLOAD_ERROR_CODES = {400, 422}
+
+
+def _gatewayapi_msisdn(number):
+    """The digits of ``number`` as an integer, None when it has none."""
+    digits = ''.join(char for char in number or '' if char.isdigit())
+    return int(digits) if digits else None
+
+
+def _split_gatewayapi_units(units):
+    """Split ``(payload item, sms.sms recordset)`` pairs in two halves. A
+    single multi-recipient message is split by recipients instead, each half
+    getting the uuid of its first record as userref."""
+    if len(units) > 1:
+        middle = len(units) // 2
+        return units[:middle], units[middle:]
+    payload_item, sms_group = units[0]
+    middle = len(sms_group) // 2
+    halves = []
+    for part in (slice(None, middle), slice(middle, None)):
+        group = sms_group[part]
+        halves.append([(
+            dict(payload_item, recipients=payload_item['recipients'][part], userref=group[:1].uuid),
+            group,
+        )])
+    return halves
+
+
+def _gatewayapi_error_key(error):
+    """HTTP status and body of the answer behind ``error``, telling apart
+    the reasons GatewayAPI gave for rejecting requests."""
+    response = getattr(error, 'response', None)
+    return gatewayapi_retry.status_code(error), response.text if response is not None else str(error)
+
+
+def _post_gatewayapi_batch(client, batch_payload_items, retry_policy=None, not_before=None):
+    """POST one batch to /rest/mtsms, retrying transient failures according
+    to ``retry_policy``. The first attempt waits until the ``not_before``
+    monotonic time granted by the rate limiter.
+
+    Returns a dict with the decoded ``content`` or the last ``error`` raised,
+    whether that error is ``retryable``, ``ambiguous`` (GatewayAPI may have
+    accepted the batch) or came from an open circuit breaker
+    (``circuit_open``), the number of ``attempts``, plus the ``latency`` of
+    the last attempt and the ``payload_bytes`` used for batch sizing.
+    """
+    outcome = {
+        'content': None, 'error': None, 'retryable': False, 'ambiguous': False, 'circuit_open': False,
+        'attempts': 0, 'latency': 0.0, 'payload_bytes': 0,
+    }
+    try:
+        # Serialised once: every attempt sends the exact same payload
+        body = json.dumps(batch_payload_items).encode()
+    except Exception as e:
+        outcome['error'] = e
+        return outcome
+    outcome['payload_bytes'] = len(body)
+
+    if not_before is not None and not_before > time.monotonic():
+        time.sleep(not_before - time.monotonic())
+    while True:
+        outcome['attempts'] += 1
+        start = time.monotonic()
+        try:
+            _logger.debug("Sending SMS batch to GatewayAPI: url=%s/rest/mtsms, count=%s, attempt=%s",
+                          client.base_url, len(batch_payload_items), outcome['attempts'])
+            response = client.post(
+                '/rest/mtsms',
+                params={'extra_details': 'recipients_usage'},
+                data=body,
+                headers={'Content-Type': 'application/json'},
+            )
+            response.raise_for_status()  # Raises HTTPError for 4xx/5xx
+            outcome.update(content=response.json(), error=None, retryable=False, ambiguous=False)
+        except gatewayapi_circuit.CircuitOpenError as e:
+            outcome.update(error=e, retryable=False, circuit_open=True)
+            return outcome
+        except Exception as e:
+            outcome.update(
+                error=e, retryable=retry_policy is not None and retry_policy.is_retryable(e),
+                ambiguous=gatewayapi_retry.is_ambiguous(e),
+            )
+        outcome['latency'] = time.monotonic() - start
+        if not outcome['retryable'] or outcome['attempts'] >= retry_policy.max_attempts:
+            return outcome
+        delay = retry_policy.delay(outcome['attempts'], outcome['error'])
+        if delay is None:
+            return outcome
+        _logger.debug("GatewayAPI batch attempt %s failed (%s), retrying in %.2fs",
+                      outcome['attempts'], outcome['error'], delay)
+        time.sleep(delay)
 
 
 class Sms(models.Model):
@@ -37,7 +147,41 @@ class Sms(models.Model):
         'SKIPPED': 'sms_other',  # From controllers/main.py
     }
 
+    # GatewayAPI delivery report status -> (Odoo state, failure type)
+    GATEWAYAPI_DLR_STATES = {
+        'DELIVERED': ('sent', False),
+        'ACCEPTED': ('sent', False),
+        'UNDELIVERABLE': ('error', 'sms_unregistered'),
+        'REJECTED': ('error', 'sms_blacklist'),
+        'EXPIRED': ('error', 'sms_other'),
+        'SKIPPED': ('error', 'sms_other'),
+    }
+    # Statuses after which GatewayAPI sends no further report
+    GATEWAYAPI_DLR_FINAL_STATUSES = {'DELIVERED', 'UNDELIVERABLE', 'REJECTED', 'EXPIRED', 'SKIPPED'}
+
     sms_api_error = fields.Char()
+    gatewayapi_lane = fields.Selection([
+        ('high', "Transactional"),
+        ('normal', "Normal"),
+        ('bulk', "Bulk"),
+    ], string="GatewayAPI Lane",
+        default=lambda self: self.env.context.get('gatewayapi_lane', 'normal'),
+        help="Transactional SMS (one-time codes, notifications) are always sent first, in small "
+             "batches and on a reserved share of the rate limit. Bulk SMS go last, in large batches. "
+             "Set it from code with the 'gatewayapi_lane' context key."
+    )
+    gatewayapi_retry_count = fields.Integer(
+        string="GatewayAPI Retries",
+        copy=False,
+        readonly=True,
+        help="Number of times sending was postponed after transient GatewayAPI failures."
+    )
+    gatewayapi_next_retry = fields.Datetime(
+        string="GatewayAPI Next Retry",
+        copy=False,
+        readonly=True,
+        help="The SMS stays in the queue and is not sent again before this time."
+    )
     gatewayapi_message_id = fields.Char(
         string="GatewayAPI Message ID",
         copy=False,
@@ -45,217 +189,781 @@ class Sms(models.Model):
         index=True
     )
 
+    def _split_batch(self):
+        if self._is_sent_with_gatewayapi():
+            # GatewayAPI supports batch sending up to 1000 messages. Lanes
+            # are drained in priority order, each with its own batch size,
+            # read lazily so it follows the adaptive sizer as responses of
+            # the previous batches come in.
+            iap_account = self.env['iap.account']._get_gatewayapi_sms_account()
+            ids_by_lane = defaultdict(list)
+            for sms in self:
+                ids_by_lane[sms.gatewayapi_lane or 'normal'].append(sms.id)
+            for lane in GATEWAYAPI_LANES:
+                lane_ids = ids_by_lane[lane]
+                i = 0
+                while i < len(lane_ids):
+                    batch_size = iap_account._get_gatewayapi_batch_size(lane)
+                    yield lane_ids[i:i + batch_size]
+                    i += batch_size
+        else:
+            # Use 'yield from' to correctly delegate to the parent method
+            yield from super()._split_batch()
+
     def _is_sent_with_gatewayapi(self):
         """Check if SMS should be sent via GatewayAPI.
         Returns True if any record in the recordset should be sent via GatewayAPI.
         """
-        iap_account = self.env['iap.account']._get_sms_account()
-        return bool(iap_account and iap_account.gatewayapi_api_token and iap_account.gatewayapi_base_url)
+        return bool(self.env['iap.account']._get_gatewayapi_send_config())
 
-    def _prepare_gatewayapi_payload_item(self, iap_account, base_url):
+    def _prepare_gatewayapi_payload_item(self, send_config):
+        """Payload of this SMS, ``send_config`` being the cached
+        ``iap.account._get_gatewayapi_send_config()``."""
         self.ensure_one()
         if not self.number:  # Should be pre-validated, but as a safeguard
             return None
 
-        # Emoji detection regex (covers most emoji ranges)
-        emoji_pattern = re.compile(
-            "[\U0001F600-\U0001F64F"  # emoticons
-            "\U0001F300-\U0001F5FF"  # symbols & pictographs
-            "\U0001F680-\U0001F6FF"  # transport & map symbols
-            "\U0001F1E0-\U0001F1FF"  # flags (iOS)
-            "\U00002700-\U000027BF"  # Dingbats
-            "\U0001F900-\U0001F9FF"  # Supplemental Symbols and Pictographs
-            "\U00002600-\U000026FF"  # Misc symbols
-            "]+", flags=re.UNICODE)
-
-        # Get the base URL for the webhook
-        callback_url = f"{base_url}/gatewayapi/dlr"
-
         payload = {
-            "sender": iap_account.gatewayapi_sender or iap_account.service_name or "Odoo",
+            "sender": send_config['sender'],
             "message": self.body,
             "recipients": [{"msisdn": int(self.number)}],  # Assuming self.number is sanitized
             "userref": self.uuid,
-            "callback_url": callback_url
+            "callback_url": send_config['callback_url'],
         }
 
-        if emoji_pattern.search(self.body):
+        # Anything outside the GSM-7 basic and extension tables (emoji,
+        # Cyrillic, CJK, ...) has to be sent as UCS-2.
+        if gatewayapi_encoding.needs_ucs2(self.body):
             payload["encoding"] = "UCS2"
 
         return payload
 
+    def gatewayapi_get_encoding_info(self):
+        """Return, per record id, the encoding GatewayAPI will use for the
+        body and the number of SMS segments it will be billed as::
+
+            {sms_id: {'encoding': 'GSM7' or 'UCS2', 'units': int, 'segments': int}}
+        """
+        bodies = self.mapped('body')
+        classified = gatewayapi_encoding.classify_many(bodies)
+        return {
+            sms.id: dict(zip(('encoding', 'units', 'segments'), classified[sms.body]))
+            for sms in self
+        }
+
+    def gatewayapi_estimate_cost(self, domain=None):
+        """Estimate segments and cost of sending the SMS of ``self`` (or, on
+        an empty recordset, of those matching ``domain``, the outgoing queue
+        by default) through the GatewayAPI account, without calling the API.
+        See ``iap.account._gatewayapi_estimate_cost``."""
+        if self and domain is not None:
+            raise UserError(_("Estimate the cost either of given SMS or of a domain, not both."))
+        iap_account = self.env['iap.account']._get_gatewayapi_sms_account()
+        if not iap_account:
+            raise UserError(_("No GatewayAPI account is configured for sending SMS."))
+        if self:
+            self.check_access_rights('read')
+            self.check_access_rule('read')
+            sms_ids = self.ids
+        else:
+            sms_ids = self.search(domain or [('state', '=', 'outgoing')]).ids
+        return iap_account.sudo()._gatewayapi_estimate_cost(sms_ids)
+
     def _send(self, unlink_failed=False, unlink_sent=True, raise_exception=False):
         """
         This method tries to send SMS after checking the number (presence and formatting).
         For GatewayAPI, it now sends messages in batches.
         """
         if self._is_sent_with_gatewayapi():
-            results = []
-            iap_account = self.env['iap.account']._get_sms_account()
+            self._gatewayapi_send_batches(
+                [self], unlink_failed=unlink_failed, unlink_sent=unlink_sent
+            )
+            return
 
-            if not iap_account or not iap_account.gatewayapi_api_token or not iap_account.gatewayapi_base_url:
-                _logger.error("GatewayAPI: Account not configured or missing token/base_url.")
-                for sms_record in self:
-                    sms_record.sms_api_error = "GatewayAPI account misconfiguration"
-                    results.append({'uuid': sms_record.uuid, 'state': 'server_error'})
-                self._postprocess_iap_sent_sms(
-                    results, unlink_failed=unlink_failed, unlink_sent=unlink_sent
+        return super(Sms, self)._send(
+            unlink_failed=unlink_failed,
+            unlink_sent=unlink_sent,
+            raise_exception=raise_exception
+        )
+
+    def send(self, unlink_failed=False, unlink_sent=True, auto_commit=False, raise_exception=False):
+        """Dispatch several GatewayAPI batches in parallel when the account
+        allows more than one concurrent request; otherwise keep the standard
+        one-batch-at-a-time behaviour."""
+        iap_account = self.env['iap.account']._get_gatewayapi_sms_account()
+        if iap_account:
+            # SMS parked after transient failures wait for their retry time
+            now = fields.Datetime.now()
+            self = self.filtered(lambda sms: not sms.gatewayapi_next_retry or sms.gatewayapi_next_retry <= now)
+        concurrency = iap_account.gatewayapi_max_concurrency if iap_account else 1
+        if concurrency <= 1:
+            return super(Sms, self).send(
+                unlink_failed=unlink_failed,
+                unlink_sent=unlink_sent,
+                auto_commit=auto_commit,
+                raise_exception=raise_exception,
+            )
+
+        sms_to_send = self.filtered(lambda sms: sms.state == 'outgoing' and not sms.to_delete)
+        batch_ids_iterator = sms_to_send._split_batch()
+        while wave := list(itertools.islice(batch_ids_iterator, concurrency)):
+            self._gatewayapi_send_batches(
+                [self.browse(batch_ids) for batch_ids in wave],
+                unlink_failed=unlink_failed,
+                unlink_sent=unlink_sent,
+            )
+            if auto_commit is True and not getattr(threading.current_thread(), 'testing', False):
+                self._cr.commit()
+
+    @api.model
+    def _process_queue(self, ids=None):
+        """Stream the outgoing queue in id-ordered chunks instead of loading it
+        at once, so memory stays flat whatever the campaign size. The chunk
+        records are dropped from the cache once sent, and SMS queued after
+        the run started are left to the next run."""
+        if not self.env['iap.account']._get_gatewayapi_sms_account():
+            return super()._process_queue(ids=ids)
+
+        res = None
+        try:
+            # auto-commit except in testing mode
+            auto_commit = not getattr(threading.current_thread(), 'testing', False)
+            for chunk_ids in self._gatewayapi_iter_queue(ids):
+                res = self.browse(chunk_ids).send(
+                    unlink_failed=False, unlink_sent=True, auto_commit=auto_commit, raise_exception=False
                 )
+                self.env.invalidate_all()
+        except Exception:
+            _logger.exception("Failed processing SMS queue")
+        return res
+
+    @api.model
+    def _gatewayapi_iter_queue(self, ids=None, chunk_size=QUEUE_CHUNK_SIZE):
+        """Yield the ids of the SMS due for sending, ``chunk_size`` at a time,
+        restricted to ``ids`` when given. Each chunk is read with a fresh
+        keyset query, so rows sent (and unlinked) meanwhile are not revisited.
+
+        Chunks never mix lanes. Before every chunk, higher priority lanes
+        are checked again, so transactional SMS queued while a campaign is
+        being sent overtake the rest of it."""
+        self.flush_model(['state', 'to_delete', 'gatewayapi_next_retry', 'gatewayapi_lane'])
+        self.env.cr.execute("SELECT MAX(id) FROM sms_sms")
+        max_id = self.env.cr.fetchone()[0]
+        last_ids = dict.fromkeys(GATEWAYAPI_LANES, 0)
+        while max_id:
+            for lane in GATEWAYAPI_LANES:
+                query = """SELECT id FROM sms_sms
+                            WHERE state = 'outgoing' AND to_delete IS NOT TRUE
+                              AND (gatewayapi_next_retry IS NULL OR gatewayapi_next_retry <= (now() at time zone 'UTC'))
+                              AND COALESCE(gatewayapi_lane, 'normal') = %s AND id > %s"""
+                params = [lane, last_ids[lane]]
+                # Transactional SMS created during the run are sent by it too
+                if lane != 'high':
+                    query += " AND id <= %s"
+                    params.append(max_id)
+                if ids:
+                    query += " AND id = ANY(%s)"
+                    params.append(list(ids))
+                self.env.cr.execute(query + " ORDER BY id LIMIT %s", params + [chunk_size])
+                chunk_ids = [row[0] for row in self.env.cr.fetchall()]
+                if chunk_ids:
+                    break
+            else:
                 return
+            yield chunk_ids
+            last_ids[lane] = chunk_ids[-1]
+
+    def _gatewayapi_send_batches(self, batches, unlink_failed=False, unlink_sent=True):
+        """Send each ``sms.sms`` recordset of ``batches`` as one /rest/mtsms
+        request. Requests run concurrently, bounded by the account's maximum
+        concurrency, and all results are post-processed in a single pass."""
+        results = []
+        all_sms = self.browse([sms_id for batch in batches for sms_id in batch.ids])
+        send_config = self.env['iap.account']._get_gatewayapi_send_config()
+
+        if not send_config:
+            _logger.error("GatewayAPI: Account not configured or missing token/base_url.")
+            for sms_record in all_sms:
+                sms_record.sms_api_error = "GatewayAPI account misconfiguration"
+                results.append({'uuid': sms_record.uuid, 'state': 'server_error'})
+            all_sms._postprocess_iap_sent_sms(
+                results, unlink_failed=unlink_failed, unlink_sent=unlink_sent
+            )
+            return
 
-            batch_payload_items = []
-            # To keep track of records for response mapping
-            sms_records_in_batch = self.env['sms.sms']
+        # Webhook URL, resolved from the web.base.url system parameter
+        if not send_config['web_base_url']:
+            _logger.error("GatewayAPI: web.base.url system parameter not set")
+            for sms_record in all_sms:
+                sms_record.sms_api_error = "System configuration error: web.base.url not set"
+                results.append({'uuid': sms_record.uuid, 'state': 'server_error'})
+            all_sms._postprocess_iap_sent_sms(
+                results, unlink_failed=unlink_failed, unlink_sent=unlink_sent
+            )
+            return
 
-            # Get webhook URL from system parameter
-            webhook_url = self.env['ir.config_parameter'].sudo().get_param('web.base.url', '')
-            if not webhook_url:
-                _logger.error("GatewayAPI: web.base.url system parameter not set")
-                for sms_record in self:
-                    sms_record.sms_api_error = "System configuration error: web.base.url not set"
-                    results.append({'uuid': sms_record.uuid, 'state': 'server_error'})
-                self._postprocess_iap_sent_sms(
-                    results, unlink_failed=unlink_failed, unlink_sent=unlink_sent
+        iap_account = self.env['iap.account'].browse(send_config['account_id'])
+
+        prepared_batches = []
+        for batch in batches:
+            batch_payload_items, message_groups = batch._gatewayapi_prepare_batch(send_config, results)
+            if not batch_payload_items:  # All records in the batch might have been skipped
+                continue
+            sms_records_in_batch = self.browse([sms_id for group in message_groups for sms_id in group.ids])
+            estimated_cost = 0.0
+            if iap_account.gatewayapi_credit_guard != 'off':
+                estimated_cost = iap_account._gatewayapi_estimate_payload_cost(batch_payload_items)
+            if not iap_account._gatewayapi_reserve_credit(estimated_cost):
+                _logger.warning(
+                    "GatewayAPI: local credit ledger (%s) cannot cover batch of %s SMS (estimated %s)",
+                    iap_account.gatewayapi_credit_available, len(sms_records_in_batch), estimated_cost,
                 )
-                return
+                sms_records_in_batch.sms_api_error = "Insufficient GatewayAPI credit (estimated cost %s)" % estimated_cost
+                if iap_account.gatewayapi_credit_guard == 'refuse':
+                    results.extend({'uuid': sms.uuid, 'state': 'credit'} for sms in sms_records_in_batch)
+                else:
+                    # 'defer': the records stay outgoing until the balance
+                    # refresh has reseeded the ledger
+                    iap_account._gatewayapi_request_balance_refresh()
+                    self._gatewayapi_wake_queue(fields.Datetime.now() + timedelta(
+                        seconds=iap_account.gatewayapi_balance_ttl or DEFAULT_BALANCE_TTL))
+                continue
+            lane = batch[:1].gatewayapi_lane or 'normal'
+            rate_wait = iap_account._gatewayapi_acquire_rate(len(sms_records_in_batch), lane)
+            if rate_wait is None:
+                # The shared rate limiter is saturated: release the credit and
+                # leave this and the remaining batches outgoing.
+                iap_account._gatewayapi_settle_credit(estimated_cost, None)
+                _logger.info("GatewayAPI: rate limit backlog too long, keeping remaining SMS queued")
+                self._gatewayapi_wake_queue(fields.Datetime.now() + timedelta(
+                    seconds=max(iap_account.gatewayapi_rate_max_wait, 1.0)))
+                break
+            prepared_batches.append((
+                batch_payload_items, message_groups, sms_records_in_batch, estimated_cost,
+                time.monotonic() + rate_wait, lane,
+            ))
+
+        client = iap_account._get_gatewayapi_client()
+        retry_policy = iap_account._get_gatewayapi_retry_policy()
+        max_workers = min(max(iap_account.gatewayapi_max_concurrency, 1), len(prepared_batches))
+        if max_workers > 1:
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gatewayapi_send') as executor:
+                responses = list(executor.map(
+                    lambda prepared: _post_gatewayapi_batch(client, prepared[0], retry_policy, prepared[4]),
+                    prepared_batches,
+                ))
+        else:
+            responses = [
+                _post_gatewayapi_batch(client, prepared[0], retry_policy, prepared[4])
+                for prepared in prepared_batches
+            ]
+
+        circuit_open = 0
+        for prepared, outcome in zip(prepared_batches, responses):
+            batch_payload_items, message_groups, sms_records_in_batch, estimated_cost, _not_before, lane = prepared
+            iap_account._gatewayapi_settle_credit(estimated_cost, outcome['content'])
+            # Transactional batches are kept small on purpose, they would
+            # mislead the adaptive sizer
+            if not outcome['circuit_open']:
+                gatewayapi_metrics.BATCH_SIZE.observe(len(sms_records_in_batch))
+                gatewayapi_metrics.BATCH_BYTES.observe(outcome['payload_bytes'])
+                if lane != 'high':
+                    iap_account._get_gatewayapi_batch_sizer(lane).observe(
+                        len(sms_records_in_batch), outcome['latency'], outcome['payload_bytes'],
+                        outcome['error'] is None
+                    )
+            if self._gatewayapi_is_payload_error(outcome['error']) and iap_account.gatewayapi_bisect_max_calls:
+                circuit_open += sms_records_in_batch._gatewayapi_bisect(
+                    iap_account, client, retry_policy, list(zip(batch_payload_items, message_groups)),
+                    outcome['error'], results, lane,
+                )
+                continue
+            circuit_open += sms_records_in_batch._gatewayapi_handle_outcome(
+                iap_account, message_groups, outcome, results
+            )
 
-            base_url = webhook_url.rstrip('/')
+        accepted = sum(1 for result in results if result['state'] == 'success')
+        _send_summary.add(batches=len(prepared_batches), accepted=accepted, failed=len(results) - accepted,
+                          circuit_open=circuit_open)
 
-            for sms_record in self:
-                if not sms_record.number:
-                    _logger.warning(f"SMS {sms_record.uuid} has no number, skipping.")
-                    results.append({'uuid': sms_record.uuid, 'state': 'wrong_number_format'})
-                    sms_record.sms_api_error = "Missing recipient number"
-                    continue  # Skip this record from batch
-
-                payload_item = sms_record._prepare_gatewayapi_payload_item(iap_account, base_url)
-                if payload_item:
-                    batch_payload_items.append(payload_item)
-                    sms_records_in_batch |= sms_record
-                else:  # Should not happen if number check is done
-                    results.append({'uuid': sms_record.uuid, 'state': 'server_error'})
-                    sms_record.sms_api_error = "Payload preparation failed"
+        if results:
+            all_sms._postprocess_iap_sent_sms(
+                results, unlink_failed=unlink_failed, unlink_sent=unlink_sent
+            )
 
-            if not batch_payload_items:  # All records in self might have been skipped
-                if results:  # If some were skipped due to no number
-                    self._postprocess_iap_sent_sms(
-                        results, unlink_failed=unlink_failed, unlink_sent=unlink_sent
-                    )
-                # else: no records to process, no results to postprocess.
-                return
+    def _gatewayapi_prepare_batch(self, send_config, results):
+        """Build the /rest/mtsms payload for the records of ``self``.
 
-            url = iap_account.gatewayapi_base_url.rstrip('/') + '/rest/mtsms?extra_details=recipients_usage'
-            token = iap_account.gatewayapi_api_token
+        Records sharing the same body, sender and encoding are collapsed into
+        a single message with one recipient per record. Records that cannot be
+        sent get their result appended to ``results``.
 
-            try:
-                _logger.debug(f"Sending SMS batch to GatewayAPI: url={url}, count={len(batch_payload_items)}")
-                response = requests.post(url, json=batch_payload_items, auth=(token, ""))
-                response.raise_for_status()  # Raises HTTPError for 4xx/5xx
-                response_content = response.json()
-                _logger.debug(f"GatewayAPI batch response: {response_content}")
-
-                # Process successful batch submission response
-                # Priority 1: Use 'details' with 'userref' for mapping
-                if response_content.get('details') and 'messages' in response_content['details']:
-                    # This is the ideal scenario with userref mapping
-                    responded_sms_map = {
-                        item['userref']: {
-                            'gw_msg_id': item.get('id'),
-                            'status_text': item.get('recipients', [{}])[0].get('status'),  # First recipient status
-                            'error_code': item.get('recipients', [{}])[0].get('error_code'),
-                            'accepted': item.get('recipients', [{}])[0].get('status') == 'SENT_OK'  # Example
-                        } for item in response_content['details']['messages'] if 'userref' in item
-                    }
+        Returns the payload items and, aligned with them, the ``sms.sms``
+        recordset each message was built from.
+        """
+        # (message, sender, encoding, duplicate index) -> [payload item, sms ids, msisdns]
+        messages = {}
+
+        for sms_record in self:
+            if not sms_record.number:
+                _logger.warning("SMS %s has no number, skipping.", sms_record.uuid)
+                results.append({'uuid': sms_record.uuid, 'state': 'wrong_number_format'})
+                sms_record.sms_api_error = "Missing recipient number"
+                continue  # Skip this record from batch
+
+            payload_item = sms_record._prepare_gatewayapi_payload_item(send_config)
+            if not payload_item:  # Should not happen if number check is done
+                results.append({'uuid': sms_record.uuid, 'state': 'server_error'})
+                sms_record.sms_api_error = "Payload preparation failed"
+                continue
+
+            msisdn = payload_item['recipients'][0]['msisdn']
+            key = (payload_item['message'], payload_item['sender'], payload_item.get('encoding'), 0)
+            # The same number twice in one message could not be told apart
+            # in the response, so duplicates go to a separate message.
+            while key in messages and msisdn in messages[key][2]:
+                key = key[:3] + (key[3] + 1,)
+            if key in messages:
+                messages[key][0]['recipients'].append({'msisdn': msisdn})
+                messages[key][1].append(sms_record.id)
+                messages[key][2].add(msisdn)
+            else:
+                # The userref of a multi-recipient message is the uuid of its first record
+                messages[key] = [payload_item, [sms_record.id], {msisdn}]
 
-                    for sms_record in sms_records_in_batch:
-                        res_item = responded_sms_map.get(sms_record.uuid)
-                        if res_item:
-                            sms_record.gatewayapi_message_id = str(res_item['gw_msg_id']) if res_item['gw_msg_id'] else None
-                            if res_item['accepted']:
-                                results.append({'uuid': sms_record.uuid, 'state': 'success'})
-                                sms_record.sms_api_error = False
-                            else:
-                                results.append({'uuid': sms_record.uuid, 'state': 'server_error'})
-                                sms_record.sms_api_error = f"Error {res_item['error_code']}: {res_item['status_text']}"
-                        else:
-                            # Message sent in batch but no corresponding item in 'details' with userref
-                            results.append({'uuid': sms_record.uuid, 'state': 'server_error'})
-                            sms_record.sms_api_error = "GatewayAPI response missing details for this SMS (userref)"
-                            _logger.warning(f"SMS {sms_record.uuid} not found in GatewayAPI 'details' response with userref.")
-
-                # Priority 2: Use 'ids' list and assume order if 'details' is not as expected
-                elif response_content.get('ids') and len(response_content['ids']) == len(sms_records_in_batch):
-                    _logger.info("GatewayAPI batch response: using 'ids' list and assuming order for mapping.")
-                    for idx, sms_record in enumerate(sms_records_in_batch):
-                        gw_msg_id = response_content['ids'][idx]
-                        sms_record.gatewayapi_message_id = str(gw_msg_id)
-                        # Assuming direct 'ids' list implies acceptance by gateway for all
-                        results.append({'uuid': sms_record.uuid, 'state': 'success'})
-                        sms_record.sms_api_error = False
-                else:
-                    # Fallback: Mark all as error if response format is unexpected
-                    _logger.error("GatewayAPI batch response: unexpected format. Data: %s", response_content)
-                    for sms_record in sms_records_in_batch:
-                        results.append({'uuid': sms_record.uuid, 'state': 'server_error'})
-                        sms_record.sms_api_error = "Unexpected GatewayAPI response format"
-
-            except requests.exceptions.RequestException as e:
-                _logger.error("GatewayAPI batch request failed: %s", str(e))
-                for sms_record in sms_records_in_batch:
-                    results.append({'uuid': sms_record.uuid, 'state': 'server_error'})
-                    sms_record.sms_api_error = f"GatewayAPI request failed: {str(e)}"
-            except Exception as e:
-                _logger.exception("GatewayAPI batch processing failed")
-                for sms_record in sms_records_in_batch:
-                    results.append({'uuid': sms_record.uuid, 'state': 'server_error'})
-                    sms_record.sms_api_error = f"GatewayAPI processing error: {str(e)}"
+        batch_payload_items = [message[0] for message in messages.values()]
+        message_groups = [self.browse(message[1]) for message in messages.values()]
+        return batch_payload_items, message_groups
 
-            self._postprocess_iap_sent_sms(
-                results, unlink_failed=unlink_failed, unlink_sent=unlink_sent
+    def _gatewayapi_handle_outcome(self, iap_account, message_groups, outcome, results):
+        """Apply the outcome of posting the records of ``self`` (one
+        ``sms.sms`` recordset per message in ``message_groups``).
+
+        Returns the number of records left outgoing because the circuit
+        breaker was open.
+        """
+        if outcome['circuit_open']:
+            # GatewayAPI is considered down: nothing was sent, the
+            # records stay outgoing for a queue run after the cooldown.
+            self.sms_api_error = str(outcome['error'])
+            self._gatewayapi_wake_queue(fields.Datetime.now() + timedelta(
+                seconds=max(outcome['error'].retry_in, 1.0)))
+            return len(self)
+        if outcome['retryable']:
+            self._gatewayapi_park(iap_account, outcome['error'], results)
+        elif outcome['ambiguous']:
+            self._gatewayapi_fail_unconfirmed(outcome['error'], results)
+        else:
+            self._gatewayapi_process_response(
+                message_groups, outcome['content'], outcome['error'], results, iap_account
             )
-            return
+        return 0
+
+    @api.model
+    def _gatewayapi_is_payload_error(self, error):
+        """Whether GatewayAPI rejected a request because of its content."""
+        return gatewayapi_retry.status_code(error) in GATEWAYAPI_PAYLOAD_ERROR_CODES
+
+    def _gatewayapi_bisect(self, iap_account, client, retry_policy, units, error, results, lane='normal'):
+        """Isolate the records that made GatewayAPI reject a whole batch.
+
+        ``units`` pairs each payload item of the rejected batch with the
+        ``sms.sms`` recordset it was built from. Rejected parts are split in
+        two and sent again, down to single recipients, which then fail with
+        ``wrong_number_format``. When the first half of a rejected part is
+        accepted, the second half is known bad without sending it; when both
+        halves are rejected with the same error, the whole request is at
+        fault and neither is split further. At most
+        ``gatewayapi_bisect_max_calls`` extra requests are made, each within
+        the rate limit; the records still unresolved after that fail as
+        before, with ``server_error``. Once the rate limiter or the circuit
+        breaker holds a request back, the remaining records stay outgoing.
+
+        Returns the number of records left outgoing by an open circuit.
+        """
+        budget = iap_account.gatewayapi_bisect_max_calls
+        circuit_open = 0
+        rejected = [(units, error)]
+        while rejected:
+            units, error = rejected.pop()
+            sms_records = self._gatewayapi_units_records(units)
+            if len(sms_records) == 1:
+                _logger.warning("GatewayAPI rejected SMS %s: %s", sms_records.uuid, error)
+                sms_records.sms_api_error = f"Rejected by GatewayAPI: {error}"
+                results.append({'uuid': sms_records.uuid, 'state': 'wrong_number_format'})
+                continue
+            if budget <= 0:
+                sms_records._gatewayapi_process_response(None, None, error, results)
+                continue
+
+            first_half, second_half = _split_gatewayapi_units(units)
+            budget -= 1
+            first = held_by = self._gatewayapi_post_units(iap_account, client, retry_policy, first_half, lane)
+            if first is None or first['circuit_open']:
+                rejected.append((units, error))
+                break
+            if first['error'] is None:
+                self._gatewayapi_apply_bisect_outcome(iap_account, first_half, first, results)
+                # The rejection came from the second half
+                rejected.append((second_half, error))
+                continue
+            if not self._gatewayapi_is_payload_error(first['error']):
+                circuit_open += self._gatewayapi_apply_bisect_outcome(iap_account, first_half, first, results)
+            # Nothing is known about the second half, it has to be sent as well
+            if budget <= 0:
+                if self._gatewayapi_is_payload_error(first['error']):
+                    rejected.append((first_half, first['error']))
+                rejected.append((second_half, error))
+                continue
+            budget -= 1
+            second = held_by = self._gatewayapi_post_units(iap_account, client, retry_policy, second_half, lane)
+            if second is None or second['circuit_open']:
+                if self._gatewayapi_is_payload_error(first['error']):
+                    rejected.append((first_half, first['error']))
+                rejected.append((second_half, error))
+                break
+            if not self._gatewayapi_is_payload_error(second['error']):
+                circuit_open += self._gatewayapi_apply_bisect_outcome(iap_account, second_half, second, results)
+                if self._gatewayapi_is_payload_error(first['error']):
+                    rejected.append((first_half, first['error']))
+            elif not self._gatewayapi_is_payload_error(first['error']):
+                rejected.append((second_half, second['error']))
+            elif _gatewayapi_error_key(first['error']) == _gatewayapi_error_key(second['error']):
+                # Both halves refused alike: the request itself is rejected
+                # (e.g. an invalid sender), not some of its recipients.
+                _logger.warning("GatewayAPI rejected every part of a batch of %s SMS alike, not splitting it "
+                                "further: %s", len(sms_records), second['error'])
+                sms_records._gatewayapi_process_response(None, None, second['error'], results)
+            else:
+                rejected.append((first_half, first['error']))
+                rejected.append((second_half, second['error']))
+
+        if rejected:
+            # Held back: sent again, and split again if still rejected, by a
+            # later queue run
+            held = self._gatewayapi_units_records([unit for units, _error in rejected for unit in units])
+            if held_by is None:
+                _logger.info("GatewayAPI: rate limit backlog too long, keeping %s SMS queued", len(held))
+                self._gatewayapi_wake_queue(fields.Datetime.now() + timedelta(
+                    seconds=max(iap_account.gatewayapi_rate_max_wait, 1.0)))
+            else:
+                circuit_open += held._gatewayapi_handle_outcome(iap_account, [held], held_by, results)
+        return circuit_open
 
-        return super(Sms, self)._send(
-            unlink_failed=unlink_failed,
-            unlink_sent=unlink_sent,
-            raise_exception=raise_exception
+    def _gatewayapi_units_records(self, units):
+        return self.browse([sms_id for _item, group in units for sms_id in group.ids])
+
+    def _gatewayapi_post_units(self, iap_account, client, retry_policy, units, lane):
+        """Post ``units`` as one /rest/mtsms request within the rate limit.
+        Returns None, without sending, when the rate limiter is saturated."""
+        rate_wait = iap_account._gatewayapi_acquire_rate(len(self._gatewayapi_units_records(units)), lane)
+        if rate_wait is None:
+            return None
+        return _post_gatewayapi_batch(
+            client, [item for item, _group in units], retry_policy, time.monotonic() + rate_wait
         )
 
-    def _split_batch(self):
-        if self._is_sent_with_gatewayapi():
-            # GatewayAPI supports batch sending up to 1000 messages.
-            # Using a smaller batch size for Odoo operations.
-            batch_size = 200  # Or make this configurable later
+    def _gatewayapi_apply_bisect_outcome(self, iap_account, units, outcome, results):
+        groups = [group for _item, group in units]
+        # Bisection calls were not reserved on the credit ledger, only charge them
+        iap_account._gatewayapi_settle_credit(0.0, outcome['content'])
+        return self.browse([sms_id for group in groups for sms_id in group.ids])._gatewayapi_handle_outcome(
+            iap_account, groups, outcome, results
+        )
 
-            all_ids = self.ids
-            for i in range(0, len(all_ids), batch_size):
-                yield all_ids[i:i + batch_size]
-        else:
-            # Use 'yield from' to correctly delegate to the parent method
-            yield from super()._split_batch()
+    def _gatewayapi_fail_unconfirmed(self, error, results):
+        """Fail the records of a batch GatewayAPI may have accepted before
+        the request failed, without sending them again."""
+        _logger.warning("GatewayAPI: outcome of a batch of %s SMS unknown, not resending it: %s", len(self), error)
+        self.sms_api_error = (
+            f"GatewayAPI may have accepted this SMS before the request failed ({error}). It was not "
+            "sent again to avoid a duplicate; check the GatewayAPI traffic log before resending."
+        )
+        results.extend({'uuid': sms.uuid, 'state': 'server_error'} for sms in self)
+
+    def _gatewayapi_park(self, iap_account, error, results):
+        """Keep the records of a batch whose retries were exhausted on a
+        transient failure in the queue, to be sent again by a later queue run
+        after a growing delay. Records parked too many times already are
+        failed instead, and their results appended to ``results``."""
+        max_parks = iap_account.gatewayapi_retry_max_parks
+        exhausted = self.filtered(lambda sms: sms.gatewayapi_retry_count >= max_parks)
+        if exhausted:
+            state = 'too_many_requests' if gatewayapi_retry.status_code(error) == 429 else 'server_error'
+            _logger.error("GatewayAPI batch request failed after %s postponed attempts: %s", max_parks, error)
+            exhausted.sms_api_error = f"GatewayAPI request failed: {error}"
+            results.extend({'uuid': sms.uuid, 'state': state} for sms in exhausted)
+
+        to_park = self - exhausted
+        if not to_park:
+            return
+        _logger.warning("GatewayAPI batch request failed (%s), postponing %s SMS", error, len(to_park))
+        now = fields.Datetime.now()
+        ids_by_count = defaultdict(list)
+        for sms in to_park:
+            ids_by_count[sms.gatewayapi_retry_count + 1].append(sms.id)
+        for retry_count, sms_ids in ids_by_count.items():
+            self.browse(sms_ids).write({
+                'gatewayapi_retry_count': retry_count,
+                'gatewayapi_next_retry': now + timedelta(seconds=gatewayapi_retry.park_delay(retry_count)),
+                'sms_api_error': f"GatewayAPI temporarily unavailable, retry {retry_count} scheduled: {error}",
+            })
+        self._gatewayapi_wake_queue(min(to_park.mapped('gatewayapi_next_retry')))
+
+    @api.model
+    def _gatewayapi_wake_queue(self, at):
+        """Run the SMS queue again at ``at``, for records left outgoing until
+        then; the queue cron may otherwise not run before the next day."""
+        cron = self.env.ref('sms.ir_cron_sms_scheduler_action', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger(at=at)
+
+    def _gatewayapi_process_response(self, message_groups, response_content, error, results, iap_account=None):
+        """Map a /rest/mtsms response (or the error raised while sending it)
+        back onto the records of ``message_groups`` (one ``sms.sms`` recordset
+        per message sent) and append their results. ``self`` holds all the
+        records of the batch, sent through ``iap_account``."""
+        if error is not None:
+            if isinstance(error, requests.exceptions.RequestException):
+                _logger.error("GatewayAPI batch request failed: %s", str(error))
+                for sms_record in self:
+                    results.append({'uuid': sms_record.uuid, 'state': 'server_error'})
+                    sms_record.sms_api_error = f"GatewayAPI request failed: {str(error)}"
+            else:
+                _logger.error("GatewayAPI batch processing failed: %s", str(error))
+                for sms_record in self:
+                    results.append({'uuid': sms_record.uuid, 'state': 'server_error'})
+                    sms_record.sms_api_error = f"GatewayAPI processing error: {str(error)}"
+            return
+
+        # (message id, msisdn, sms id, sms uuid) of the accepted recipients
+        lookup_rows = []
+        try:
+            _logger.debug("GatewayAPI batch response: %s", response_content)
+
+            # Process successful batch submission response
+            # Priority 1: Use 'details', matching messages by 'userref' and
+            # recipients by 'msisdn'
+            if response_content.get('details') and 'messages' in response_content['details']:
+                responded_messages = {
+                    item['userref']: item
+                    for item in response_content['details']['messages'] if 'userref' in item
+                }
+
+                for sms_group in message_groups:
+                    item = responded_messages.get(sms_group[:1].uuid)
+                    if not item:
+                        # Message sent in batch but no corresponding item in 'details' with userref
+                        for sms_record in sms_group:
+                            results.append({'uuid': sms_record.uuid, 'state': 'server_error'})
+                            sms_record.sms_api_error = "GatewayAPI response missing details for this SMS (userref)"
+                            _logger.warning("SMS %s not found in GatewayAPI 'details' response with userref.", sms_record.uuid)
+                        continue
+
+                    gw_msg_id = str(item['id']) if item.get('id') else None
+                    recipients = item.get('recipients') or [{}]
+                    recipients_by_msisdn = {
+                        str(recipient['msisdn']): recipient for recipient in recipients if 'msisdn' in recipient
+                    }
+                    for sms_record in sms_group:
+                        recipient = recipients_by_msisdn.get(str(int(sms_record.number)))
+                        if recipient is None and len(sms_group) == 1:
+                            recipient = recipients[0]  # Single recipient message
+                        sms_record.gatewayapi_message_id = gw_msg_id
+                        if recipient is not None and recipient.get('status') == 'SENT_OK':
+                            results.append({'uuid': sms_record.uuid, 'state': 'success'})
+                            sms_record.sms_api_error = False
+                            if gw_msg_id:
+                                msisdn = _gatewayapi_msisdn(str(recipient.get('msisdn') or sms_record.number))
+                                lookup_rows.append((int(gw_msg_id), msisdn, sms_record.id, sms_record.uuid))
+                        else:
+                            recipient = recipient or {}
+                            results.append({'uuid': sms_record.uuid, 'state': 'server_error'})
+                            sms_record.sms_api_error = f"Error {recipient.get('error_code')}: {recipient.get('status')}"
+
+            # Priority 2: Use 'ids' list (one id per message) and assume order
+            # if 'details' is not as expected
+            elif response_content.get('ids') and len(response_content['ids']) == len(message_groups):
+                _logger.debug("GatewayAPI batch response: using 'ids' list and assuming order for mapping.")
+                for gw_msg_id, sms_group in zip(response_content['ids'], message_groups):
+                    sms_group.gatewayapi_message_id = str(gw_msg_id)
+                    # Assuming direct 'ids' list implies acceptance by gateway for all
+                    sms_group.sms_api_error = False
+                    results.extend({'uuid': sms_record.uuid, 'state': 'success'} for sms_record in sms_group)
+                    lookup_rows.extend(
+                        (int(gw_msg_id), _gatewayapi_msisdn(sms_record.number), sms_record.id, sms_record.uuid)
+                        for sms_record in sms_group
+                    )
+            else:
+                # Fallback: Mark all as error if response format is unexpected
+                _logger.error("GatewayAPI batch response: unexpected format. Data: %s", response_content)
+                for sms_record in self:
+                    results.append({'uuid': sms_record.uuid, 'state': 'server_error'})
+                    sms_record.sms_api_error = "Unexpected GatewayAPI response format"
+        except Exception as e:
+            _logger.exception("GatewayAPI batch processing failed")
+            for sms_record in self:
+                results.append({'uuid': sms_record.uuid, 'state': 'server_error'})
+                sms_record.sms_api_error = f"GatewayAPI processing error: {str(e)}"
+        self.env['gatewayapi.message.lookup']._register(lookup_rows, iap_account.id if iap_account else None)
+
+    @api.model
+    def _gatewayapi_apply_delivery_report(self, data):
+        """Apply one GatewayAPI delivery report (the decoded webhook payload)
+        to the ``sms.sms`` it refers to. Returns that record, empty if it
+        could not be found."""
+        return self._gatewayapi_apply_delivery_reports([(
+            data.get('id'), data.get('status'), data.get('error'), data.get('time'), data.get('msisdn'),
+        )])
+
+    @api.model
+    def _gatewayapi_apply_delivery_reports(self, reports):
+        """Apply ``(message id, status, error, timestamp[, msisdn])`` delivery
+        reports in bulk, the latest report of each recipient winning. Returns
+        the ``sms.sms`` records they resolved to."""
+        latest = {}
+        for message_id, status, error, timestamp, *msisdn in reports:
+            if not message_id:
+                continue
+            try:
+                message_id = int(message_id)
+            except (TypeError, ValueError):
+                _dlr_logger.warning("GatewayAPI DLR: ignoring report with invalid message id %r", message_id)
+                continue
+            msisdn = str(msisdn[0]) if msisdn and msisdn[0] else None
+            key = (message_id, msisdn)
+            if key not in latest or (timestamp or 0) >= (latest[key][2] or 0):
+                latest[key] = (status, error, timestamp)
+        if not latest:
+            return self.browse()
+
+        # message id -> [(msisdn, lookup id, sms id, tracker id, state, failure type, sent at)]
+        Lookup = self.env['gatewayapi.message.lookup']
+        self.flush_model(['gatewayapi_message_id', 'number', 'state', 'failure_type'])
+        message_ids = {message_id for message_id, __ in latest}
+        rows_by_message = Lookup._resolve(message_ids)
+        if unindexed_ids := message_ids.difference(rows_by_message):
+            self.env.cr.execute(
+                """SELECT id, gatewayapi_message_id, number, state, failure_type, write_date
+                     FROM sms_sms
+                    WHERE gatewayapi_message_id = ANY(%s)""",
+                [[str(message_id) for message_id in unindexed_ids]],
+            )
+            for sms_id, message_id, number, state, failure_type, write_date in self.env.cr.fetchall():
+                # Sent records are only written again by a state-changing
+                # report, so write_date is still the time they were sent.
+                rows_by_message.setdefault(int(message_id), []).append((
+                    (number or '').lstrip('+'), None, sms_id, None, state, failure_type,
+                    write_date if state == 'sent' else None,
+                ))
+
+        # (state, failure type, error) -> sms ids, resp. tracker ids
+        ids_by_outcome = defaultdict(list)
+        tracker_ids_by_outcome = defaultdict(list)
+        # final status -> lookup ids
+        lookup_ids_by_status = defaultdict(list)
+        found_ids = []
+        now = fields.Datetime.now()
+        for (message_id, msisdn), (status, error, __) in latest.items():
+            rows = rows_by_message.get(message_id)
+            if rows and len(rows) > 1 and msisdn:
+                rows = [row for row in rows if row[0] == msisdn]
+            if not rows:
+                _dlr_logger.debug(
+                    "GatewayAPI DLR: No sms.sms record found for gatewayapi_message_id: %s", message_id
+                )
+                continue
+            __, lookup_id, sms_id, tracker_id, current_state, current_failure_type, sent_at = rows[0]
+            gatewayapi_metrics.DLR_REPORTS.inc(status=status)
+            if lookup_id and status in self.GATEWAYAPI_DLR_FINAL_STATUSES:
+                lookup_ids_by_status[status].append(lookup_id)
+            if sent_at:
+                gatewayapi_metrics.DLR_LAG.observe((now - sent_at).total_seconds())
+            if not sms_id:
+                # The sms.sms is gone, only its tracker is left to update
+                if tracker_id and status in self.GATEWAYAPI_DLR_STATES:
+                    tracker_ids_by_outcome[self.GATEWAYAPI_DLR_STATES[status]].append(tracker_id)
+                continue
+            found_ids.append(sms_id)
+            new_state, failure_type = self.GATEWAYAPI_DLR_STATES.get(status, (current_state, current_failure_type))
+            if new_state != current_state or failure_type != current_failure_type:
+                ids_by_outcome[(new_state, failure_type, error or False)].append(sms_id)
+
+        SmsSudo = self.sudo().with_context(sms_skip_msg_notification=True)
+        for (state, failure_type, error), sms_ids in ids_by_outcome.items():
+            sms_sudo = SmsSudo.browse(sms_ids)
+            sms_sudo.sms_tracker_id._action_update_from_sms_state(state, failure_type=failure_type)
+            sms_sudo.write({'state': state, 'failure_type': failure_type, 'sms_api_error': error})
+            _dlr_logger.debug(
+                "GatewayAPI DLR: Updated %s SMS to state %s (failure type: %s)", len(sms_ids), state, failure_type
+            )
+        updated_ids = [sms_id for sms_ids in ids_by_outcome.values() for sms_id in sms_ids]
+        if updated_ids:
+            SmsSudo.browse(updated_ids).mail_message_id._notify_message_notification_update()
+
+        Lookup._mark_final(lookup_ids_by_status)
+        TrackerSudo = self.env['sms.tracker'].sudo()
+        updated_trackers = TrackerSudo
+        for (state, failure_type), tracker_ids in tracker_ids_by_outcome.items():
+            trackers = TrackerSudo.browse(tracker_ids).exists()
+            trackers._action_update_from_sms_state(state, failure_type=failure_type)
+            updated_trackers |= trackers
+        if updated_trackers:
+            updated_trackers.mail_notification_id.mail_message_id._notify_message_notification_update()
+
+        _dlr_summary.add(
+            reports=len(latest), updated=len(updated_ids) + len(updated_trackers),
+            unknown=len(latest) - len(found_ids) - sum(len(ids) for ids in tracker_ids_by_outcome.values()),
+        )
+        return self.browse(found_ids)
 
     def _postprocess_iap_sent_sms(self, results, unlink_failed=False, unlink_sent=True):
+        start = time.monotonic()
         # Defensive: ensure all 'state' values are strings
         for result in results:
             if not isinstance(result.get('state'), str):
-                _logger.error(f"Result with non-string state: {result}")
+                _logger.error("Result with non-string state: %s", result)
                 result['state'] = str(result.get('state'))
-        results_uuids = [result['uuid'] for result in results]
-        all_sms_sudo = self.env['sms.sms'].sudo().search([('uuid', 'in', results_uuids)]).with_context(sms_skip_msg_notification=True)
-
-        for iap_state, results_group in tools.groupby(results, key=lambda result: result['state']):
-            sms_sudo = all_sms_sudo.filtered(lambda s: s.uuid in {result['uuid'] for result in results_group})
+        state_by_uuid = {result['uuid']: result['state'] for result in results}
+
+        # self usually already holds the records the results are about; only
+        # search for the uuids it does not cover.
+        sms_id_by_uuid = {sms.uuid: sms.id for sms in self.sudo() if sms.uuid in state_by_uuid}
+        missing_uuids = [uuid for uuid in state_by_uuid if uuid not in sms_id_by_uuid]
+        if missing_uuids:
+            for sms in self.env['sms.sms'].sudo().search([('uuid', 'in', missing_uuids)]):
+                sms_id_by_uuid[sms.uuid] = sms.id
+
+        # (odoo state, failure type, provider error) -> sms ids
+        ids_by_outcome = defaultdict(list)
+        for uuid, iap_state in state_by_uuid.items():
+            sms_id = sms_id_by_uuid.get(uuid)
+            if not sms_id:
+                continue
             if success_state := self.IAP_TO_SMS_STATE_SUCCESS.get(iap_state):
-                sms_sudo.sms_tracker_id._action_update_from_sms_state(success_state)
-                to_delete = {'to_delete': True} if unlink_sent else {}
-                sms_sudo.write({'state': success_state, 'failure_type': False, **to_delete})
+                ids_by_outcome[(success_state, False, False)].append(sms_id)
             else:
                 failure_type = self.IAP_TO_SMS_FAILURE_TYPE.get(iap_state, 'unknown')
-                if failure_type != 'unknown':
-                    sms_sudo.sms_tracker_id._action_update_from_sms_state('error', failure_type=failure_type)
+                provider_error = iap_state if failure_type == 'unknown' else False
+                ids_by_outcome[('error', failure_type, provider_error)].append(sms_id)
+
+        SmsSudo = self.env['sms.sms'].sudo().with_context(sms_skip_msg_notification=True)
+        for (state, failure_type, provider_error), sms_ids in ids_by_outcome.items():
+            sms_sudo = SmsSudo.browse(sms_ids)
+            if state != 'error':
+                sms_sudo.sms_tracker_id._action_update_from_sms_state(state)
+                to_delete = {'to_delete': True} if unlink_sent else {}
+            else:
+                if provider_error:
+                    sms_sudo.sms_tracker_id._action_update_from_provider_error(provider_error)
                 else:
-                    sms_sudo.sms_tracker_id._action_update_from_provider_error(iap_state)
+                    sms_sudo.sms_tracker_id._action_update_from_sms_state('error', failure_type=failure_type)
                 to_delete = {'to_delete': True} if unlink_failed else {}
-                sms_sudo.write({'state': 'error', 'failure_type': failure_type, **to_delete})
+            sms_sudo.write({'state': state, 'failure_type': failure_type, **to_delete})
+            if state != 'error':
+                gatewayapi_metrics.SMS_SENT.inc(len(sms_ids))
+            else:
+                gatewayapi_metrics.SMS_FAILED.inc(len(sms_ids), failure_type=failure_type)
 
-        all_sms_sudo.mail_message_id._notify_message_notification_update()
+        SmsSudo.browse(list(sms_id_by_uuid.values())).mail_message_id._notify_message_notification_update()
+        gatewayapi_metrics.POSTPROCESS_LATENCY.observe(time.monotonic() - start)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the GatewayAPI send and delivery report paths, run against the
+local mock server (scripts/mock_gatewayapi_server.py) so no network access
+or GatewayAPI account is needed.
+
+For every size (1k, 10k and 100k messages by default) it measures the
+throughput (messages/s), the p50/p99 latency and the peak Python memory of:
+    - Sms.send / Sms._send, latency per /rest/mtsms batch
+    - Sms._postprocess_iap_sent_sms
+    - the /gatewayapi/dlr handler work: JWT verification and the delivery
+      report update (synchronous mode) or the queue insert (asynchronous
+      mode), latency per report, plus the bulk apply done by the queue cron
+
+Usage:
+    Run it from the module directory in the Odoo shell of a test database:
+
+    python odoo-bin shell -c /path/to/odoo.conf -d your_database --addons-path=/path/to/addons
+
+    Then in the shell:
+
+    exec(open('scripts/benchmark_gatewayapi.py').read())
+
+    Environment variables:
+        BENCH_SIZES          comma separated message counts (default 1000,10000,100000)
+        BENCH_MOCK_URL       URL of an already running mock server; by default
+                             one is started in-process
+        BENCH_MOCK_LATENCY   latency of the in-process mock server in seconds (default 0.02)
+        BENCH_CONCURRENCY    maximum concurrent requests of the account (default: unchanged)
+
+Everything runs in the current transaction, which is rolled back at the end.
+"""
+
+import importlib.util
+import json
+import os
+import time
+import tracemalloc
+import uuid
+
+import jwt
+
+from odoo.addons.gatewayapi_sms.models import sms_sms as sms_sms_module
+from odoo.addons.gatewayapi_sms.tools import gatewayapi_webhook_auth
+
+SIZES = [int(size) for size in os.environ.get('BENCH_SIZES', '1000,10000,100000').split(',') if size]
+MOCK_URL = os.environ.get('BENCH_MOCK_URL')
+MOCK_LATENCY = float(os.environ.get('BENCH_MOCK_LATENCY', '0.02'))
+CONCURRENCY = os.environ.get('BENCH_CONCURRENCY')
+JWT_SECRET = 'benchmark-secret'
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def measure(name, size, run):
+    """Run ``run()``, which returns a list of latencies in seconds, and
+    print one result line."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    latencies = run() or []
+    elapsed = time.perf_counter() - start
+    __, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<32} {size:>7} {elapsed:>9.2f} {size / elapsed if elapsed else 0:>10.0f} "
+          f"{percentile(latencies, 0.5) * 1000:>9.2f} {percentile(latencies, 0.99) * 1000:>9.2f} "
+          f"{peak / 2 ** 20:>9.1f}")
+
+
+def create_sms(count, number_offset=0):
+    return env['sms.sms'].sudo().create([{
+        'number': str(4520000000 + number_offset + i),
+        'body': f"Benchmark message {i}, your code is {i % 1000000:06d}",
+        'state': 'outgoing',
+    } for i in range(count)])
+
+
+def bench_send(sms):
+    batch_latencies = []
+    post_batch = sms_sms_module._post_gatewayapi_batch
+
+    def timed_post_batch(*args, **kwargs):
+        outcome = post_batch(*args, **kwargs)
+        batch_latencies.append(outcome['latency'])
+        return outcome
+
+    sms_sms_module._post_gatewayapi_batch = timed_post_batch
+    try:
+        sms.send(unlink_failed=False, unlink_sent=False, auto_commit=False, raise_exception=False)
+    finally:
+        sms_sms_module._post_gatewayapi_batch = post_batch
+    return batch_latencies
+
+
+def bench_postprocess(sms):
+    results = [
+        {'uuid': uuid_, 'state': 'success' if i % 10 else 'wrong_number_format'}
+        for i, uuid_ in enumerate(sms.mapped('uuid'))
+    ]
+    sms._postprocess_iap_sent_sms(results, unlink_failed=False, unlink_sent=True)
+
+
+def delivery_reports(sms):
+    now = int(time.time())
+    return [{
+        'id': int(record.gatewayapi_message_id),
+        'msisdn': int(record.number),
+        'status': 'DELIVERED',
+        'time': now,
+    } for record in sms if record.gatewayapi_message_id]
+
+
+def bench_dlr_sync(reports, tokens):
+    SmsSudo = env['sms.sms'].sudo()
+    secrets = env['gatewayapi.dlr'].sudo()._get_webhook_auth_config()['secrets'] or (JWT_SECRET,)
+    latencies = []
+    for report, token in zip(reports, tokens):
+        start = time.perf_counter()
+        gatewayapi_webhook_auth.verify(token, secrets)
+        SmsSudo._gatewayapi_apply_delivery_report(report)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_dlr_enqueue(reports):
+    Dlr = env['gatewayapi.dlr'].sudo()
+    latencies = []
+    for report in reports:
+        start = time.perf_counter()
+        Dlr._enqueue(json.dumps(report))
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_dlr_bulk(reports):
+    env['sms.sms'].sudo()._gatewayapi_apply_delivery_reports([
+        (report['id'], report['status'], None, report['time'], report['msisdn']) for report in reports
+    ])
+
+
+mock_server = None
+if not MOCK_URL:
+    spec = importlib.util.spec_from_file_location(
+        'mock_gatewayapi_server', os.path.join('scripts', 'mock_gatewayapi_server.py')
+    )
+    mock_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mock_module)
+    mock_server = mock_module.start_server(latency=MOCK_LATENCY, credit=10 ** 9)
+    MOCK_URL = mock_server.url
+
+try:
+    account = env['iap.account'].sudo()._get_gatewayapi_sms_account()
+    account_vals = {
+        'gatewayapi_base_url': MOCK_URL,
+        'gatewayapi_api_token': 'benchmark',
+        'gatewayapi_rate_messages': 0,
+        'gatewayapi_rate_requests': 0,
+        'gatewayapi_credit_guard': 'off',
+    }
+    if CONCURRENCY:
+        account_vals['gatewayapi_max_concurrency'] = int(CONCURRENCY)
+    if account:
+        account.write(account_vals)
+    else:
+        account = env['iap.account'].sudo().create(dict(
+            account_vals, name='GatewayAPI benchmark', service_name='sms', provider='sms_api_gatewayapi',
+        ))
+    env['ir.config_parameter'].sudo().set_param('gatewayapi.webhook_jwt_secret', JWT_SECRET)
+    print(f"GatewayAPI benchmark against {MOCK_URL}, account {account.id}, "
+          f"concurrency {account.gatewayapi_max_concurrency}")
+    print(f"{'stage':<32} {'size':>7} {'seconds':>9} {'msg/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'peak MiB':>9}")
+
+    for size in SIZES:
+        sms = create_sms(size)
+        env.flush_all()
+        measure("send (per batch latency)", size, lambda: bench_send(sms))
+        env.flush_all()
+
+        reports = delivery_reports(sms)
+        tokens = [
+            jwt.encode(dict(report, jti=uuid.uuid4().hex, exp=int(time.time()) + 3600), JWT_SECRET, algorithm='HS256')
+            for report in reports
+        ]
+        measure("dlr webhook, sync (per report)", len(reports), lambda: bench_dlr_sync(reports, tokens))
+        measure("dlr webhook, async (per report)", len(reports), lambda: bench_dlr_enqueue(reports))
+        measure("dlr queue bulk apply", len(reports), lambda: bench_dlr_bulk(reports))
+        env.flush_all()
+
+        sms_postprocess = create_sms(size, number_offset=size)
+        env.flush_all()
+        measure("_postprocess_iap_sent_sms", size, lambda: bench_postprocess(sms_postprocess))
+        env.flush_all()
+        env.invalidate_all()
+
+    if mock_server:
+        print(f"Mock server counters: {dict(mock_server.stats)}")
+finally:
+    env.cr.rollback()
+    env.registry.clear_cache()
+    if mock_server:
+        mock_server.shutdown()
+    print("Benchmark data rolled back.")
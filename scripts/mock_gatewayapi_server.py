@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Local stand-in for the GatewayAPI REST endpoints used by the module.
+
+It answers /rest/mtsms, /rest/mtsms/<id> and /rest/me like GatewayAPI does, and can inject
+latency, server errors and 429 (rate limited) answers, reject invalid
+recipients with 422, and fire delivery reports back to the callback_url of
+the messages. Only the Python standard library is used, so it runs without
+network access or a GatewayAPI account.
+
+Usage:
+    python3 mock_gatewayapi_server.py --port 8765 --latency 0.05 --error-rate 0.01
+
+Then point the GatewayAPI Base URL of the IAP account to
+http://127.0.0.1:8765 (any API token is accepted). GET /_mock/stats returns
+the request counters.
+
+It can also be started from Python, e.g. by scripts/benchmark_gatewayapi.py:
+    server = start_server(port=0, latency=0.02)
+    print(server.url)
+    ...
+    server.shutdown()
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import itertools
+import json
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import Request, urlopen
+
+PRICE_PER_SEGMENT = 0.03
+GSM7_SEGMENT = 153
+UCS2_SEGMENT = 67
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def sign_jwt(payload, secret):
+    """HS256 JWT as sent by GatewayAPI in the X-Gwapi-Signature header."""
+    header = _b64(json.dumps({'alg': 'HS256', 'typ': 'JWT'}).encode())
+    body = _b64(json.dumps(payload).encode())
+    signature = hmac.new(secret.encode(), f'{header}.{body}'.encode(), hashlib.sha256).digest()
+    return f'{header}.{body}.{_b64(signature)}'
+
+
+def _segments(message, encoding):
+    per_segment = UCS2_SEGMENT if encoding == 'UCS2' else GSM7_SEGMENT
+    return max(-(-len(message or '') // per_segment), 1)
+
+
+class MockGatewayApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit_rate=0.0,
+                 retry_after=1, reject_prefix=None, credit=1000.0, dlr=False, dlr_delay=0.0,
+                 dlr_secret=None, dlr_status='DELIVERED', quiet=True):
+        super().__init__(address, MockHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.reject_prefix = reject_prefix
+        self.credit = credit
+        self.dlr = dlr
+        self.dlr_delay = dlr_delay
+        self.dlr_secret = dlr_secret
+        self.dlr_status = dlr_status
+        self.quiet = quiet
+        self.stats = Counter()
+        self.lock = threading.Lock()
+        self.message_ids = itertools.count(100000000)
+        # message id -> recipient msisdns, for the status endpoint
+        self.messages = {}
+        self.dlr_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='mock_dlr') if dlr else None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count(self, **counts):
+        with self.lock:
+            self.stats.update(counts)
+
+    def fire_dlrs(self, reports):
+        """POST one delivery report per recipient to its callback URL."""
+        if self.dlr_delay:
+            time.sleep(self.dlr_delay)
+        for callback_url, report in reports:
+            headers = {'Content-Type': 'application/json'}
+            if self.dlr_secret:
+                headers['X-Gwapi-Signature'] = sign_jwt(
+                    dict(report, iat=int(time.time()), exp=int(time.time()) + 300), self.dlr_secret
+                )
+            try:
+                urlopen(Request(callback_url, json.dumps(report).encode(), headers), timeout=10).read()
+                self.count(dlr_sent=1)
+            except Exception:
+                self.count(dlr_failed=1)
+
+    def shutdown(self):
+        super().shutdown()
+        self.server_close()
+        if self.dlr_executor:
+            self.dlr_executor.shutdown(wait=False)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _reply(self, status, content, headers=None):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _simulate(self):
+        """Apply the configured latency and injected failures. Returns True
+        when an error answer was sent."""
+        server = self.server
+        delay = server.latency + random.uniform(0, server.jitter) if server.jitter else server.latency
+        if delay:
+            time.sleep(delay)
+        if server.rate_limit_rate and random.random() < server.rate_limit_rate:
+            server.count(rate_limited=1)
+            self._reply(429, {'message': 'Too many requests'}, {'Retry-After': str(server.retry_after)})
+            return True
+        if server.error_rate and random.random() < server.error_rate:
+            server.count(server_errors=1)
+            self._reply(503, {'message': 'Service unavailable'})
+            return True
+        return False
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/_mock/stats':
+            with self.server.lock:
+                return self._reply(200, dict(self.server.stats))
+        if path.startswith('/rest/mtsms/'):
+            return self._message_status(path.rsplit('/', 1)[1])
+        if path != '/rest/me':
+            return self._reply(404, {'message': 'Not found'})
+        self.server.count(me_requests=1)
+        if self._simulate():
+            return
+        self._reply(200, {'credit': round(self.server.credit, 6), 'currency': 'DKK', 'id': 1})
+
+    def _message_status(self, message_id):
+        self.server.count(status_requests=1)
+        if self._simulate():
+            return
+        with self.server.lock:
+            msisdns = self.server.messages.get(int(message_id)) if message_id.isdigit() else None
+        if msisdns is None:
+            return self._reply(404, {'message': 'Message not found'})
+        now = int(time.time())
+        self._reply(200, {
+            'id': int(message_id),
+            'recipients': [
+                {'msisdn': msisdn, 'dsnstatus': self.server.dlr_status, 'dsnerror': None, 'dsntime': now}
+                for msisdn in msisdns
+            ],
+        })
+
+    def do_POST(self):
+        path = self.path.split('?', 1)[0]
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length)
+        if path != '/rest/mtsms':
+            return self._reply(404, {'message': 'Not found'})
+        self.server.count(mtsms_requests=1)
+        if self._simulate():
+            return
+        try:
+            messages = json.loads(raw)
+            if isinstance(messages, dict):
+                messages = [messages]
+        except ValueError:
+            return self._reply(400, {'message': 'Invalid JSON'})
+
+        reject_prefix = self.server.reject_prefix
+        for message in messages:
+            for recipient in message.get('recipients') or []:
+                msisdn = str(recipient.get('msisdn', ''))
+                if not msisdn.isdigit() or (reject_prefix and msisdn.startswith(reject_prefix)):
+                    self.server.count(rejected_requests=1)
+                    return self._reply(422, {'message': f'Invalid recipient {msisdn}'})
+
+        ids, details, reports = [], [], []
+        total_cost = 0.0
+        now = int(time.time())
+        for message in messages:
+            message_id = next(self.server.message_ids)
+            recipients = message.get('recipients') or []
+            segments = _segments(message.get('message'), message.get('encoding'))
+            total_cost += segments * len(recipients) * PRICE_PER_SEGMENT
+            ids.append(message_id)
+            with self.server.lock:
+                self.server.messages[message_id] = [recipient['msisdn'] for recipient in recipients]
+            details.append({
+                'id': message_id,
+                'userref': message.get('userref'),
+                'recipients': [
+                    {'msisdn': recipient['msisdn'], 'status': 'SENT_OK', 'segments': segments}
+                    for recipient in recipients
+                ],
+            })
+            if self.server.dlr and message.get('callback_url'):
+                reports.extend((message['callback_url'], {
+                    'id': message_id,
+                    'msisdn': recipient['msisdn'],
+                    'status': self.server.dlr_status,
+                    'time': now,
+                    'userref': message.get('userref'),
+                }) for recipient in recipients)
+        with self.server.lock:
+            self.server.credit -= total_cost
+            self.server.stats.update(messages=len(messages), recipients=sum(
+                len(message.get('recipients') or []) for message in messages
+            ))
+        if reports:
+            self.server.dlr_executor.submit(self.server.fire_dlrs, reports)
+        self._reply(200, {
+            'ids': ids,
+            'usage': {'currency': 'DKK', 'total_cost': round(total_cost, 6)},
+            'details': {'messages': details},
+        })
+
+
+def start_server(host='127.0.0.1', port=0, **options):
+    """Start the mock server in a daemon thread and return it."""
+    server = MockGatewayApiServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, name='mock_gatewayapi', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every answer')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra seconds, up to this value')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 503')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Share of requests answered with 429')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with 429')
+    parser.add_argument('--reject-prefix', help='Reject batches with a recipient starting with this prefix (422)')
+    parser.add_argument('--credit', type=float, default=1000.0, help='Initial credit reported by /rest/me')
+    parser.add_argument('--dlr', action='store_true', help='POST delivery reports to the callback_url')
+    parser.add_argument('--dlr-delay', type=float, default=0.0, help='Seconds before delivery reports are sent')
+    parser.add_argument('--dlr-secret', help='Sign delivery reports with this JWT secret')
+    parser.add_argument('--dlr-status', default='DELIVERED', help='Status of the delivery reports')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    args = parser.parse_args()
+
+    server = MockGatewayApiServer(
+        (args.host, args.port), latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after, reject_prefix=args.reject_prefix,
+        credit=args.credit, dlr=args.dlr, dlr_delay=args.dlr_delay, dlr_secret=args.dlr_secret,
+        dlr_status=args.dlr_status, quiet=not args.verbose,
+    )
+    print(f"Mock GatewayAPI listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
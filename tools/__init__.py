@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+from . import gatewayapi_circuit
+from . import gatewayapi_client
+from . import gatewayapi_batcher
+from . import gatewayapi_encoding
+from . import gatewayapi_webhook_auth
+from . import gatewayapi_logging
+from . import gatewayapi_metrics
+from . import gatewayapi_retry
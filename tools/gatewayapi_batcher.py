@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Adaptive sizing of /rest/mtsms batches.
+
+The batch size grows while GatewayAPI answers quickly and without errors and
+shrinks as soon as requests get slow, too large or start failing, always
+staying between ``MIN_BATCH_SIZE`` and the account's upper bound. One sizer is
+kept per ``iap.account`` (and per lane for bulk traffic) and per worker
+process, and every change of its size is logged.
+"""
+
+import threading
+
+from . import gatewayapi_logging
+
+_logger = gatewayapi_logging.get_logger(gatewayapi_logging.SEND)
+
+MIN_BATCH_SIZE = 10
+DEFAULT_BATCH_SIZE = 200
+MAX_BATCH_SIZE = 1000  # Hard limit of messages per /rest/mtsms request
+TARGET_LATENCY = 2.0  # seconds
+MAX_PAYLOAD_BYTES = 1024 * 1024
+GROWTH_FACTOR = 1.25
+ERROR_SHRINK_FACTOR = 0.5
+ERROR_RATE_ALPHA = 0.2
+ERROR_RATE_THRESHOLD = 0.05
+
+_sizers = {}
+_sizers_lock = threading.Lock()
+
+
+def _upper_bound(max_size):
+    return max(min(max_size or MAX_BATCH_SIZE, MAX_BATCH_SIZE), MIN_BATCH_SIZE)
+
+
+class AdaptiveBatchSizer:
+    """Additive-growth / multiplicative-shrink batch size controller."""
+
+    def __init__(self, size=DEFAULT_BATCH_SIZE, max_size=MAX_BATCH_SIZE, key=None):
+        self.key = key
+        self.max_size = _upper_bound(max_size)
+        self.size = self._clamp(size or DEFAULT_BATCH_SIZE)
+        self.error_rate = 0.0
+        self._lock = threading.Lock()
+
+    def _clamp(self, size):
+        return int(max(MIN_BATCH_SIZE, min(size, self.max_size)))
+
+    def observe(self, batch_size, latency, payload_bytes, ok):
+        """Feed the outcome of one request and return the new batch size."""
+        with self._lock:
+            self.error_rate += ERROR_RATE_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+            size = self.size
+            if not ok:
+                size *= ERROR_SHRINK_FACTOR
+            elif latency > TARGET_LATENCY:
+                size *= max(TARGET_LATENCY / latency, ERROR_SHRINK_FACTOR)
+            elif batch_size >= self.size and self.error_rate < ERROR_RATE_THRESHOLD:
+                # Only a full batch tells us something about a larger one.
+                size *= GROWTH_FACTOR
+            if batch_size and payload_bytes:
+                size = min(size, MAX_PAYLOAD_BYTES * batch_size / payload_bytes)
+            previous, size = self.size, self._clamp(size)
+            self.size = size
+            error_rate = self.error_rate
+        if size != previous:
+            _logger.info("GatewayAPI batch size of %s: %s -> %s (latency %.2fs, error rate %.2f)",
+                         self.key, previous, size, latency, error_rate)
+        return size
+
+
+def get_sizer(key, size=DEFAULT_BATCH_SIZE, max_size=MAX_BATCH_SIZE):
+    """Return the batch sizer of ``key`` (an account id, or an account id
+    and lane), seeding it with ``size`` the first time and following changes
+    of its upper bound."""
+    with _sizers_lock:
+        sizer = _sizers.get(key)
+        if sizer is None:
+            sizer = _sizers[key] = AdaptiveBatchSizer(size, max_size, key)
+        elif sizer.max_size != _upper_bound(max_size):
+            with sizer._lock:
+                sizer.max_size = _upper_bound(max_size)
+                sizer.size = sizer._clamp(sizer.size)
+        return sizer
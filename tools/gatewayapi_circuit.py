@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Circuit breaker for the GatewayAPI endpoints.
+
+A breaker guards one endpoint of one account in one worker process. It
+opens after ``failure_threshold`` consecutive failures, a failure being a
+network error, a 5xx answer or a call slower than ``latency_threshold``.
+While open, calls fail immediately with :class:`CircuitOpenError` instead
+of waiting for the network. Once ``cooldown`` seconds have passed a single
+probe call is let through (half-open): it closes the breaker on success and
+reopens it, with a doubled cooldown, on failure.
+"""
+
+import logging
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_LATENCY_THRESHOLD = 10.0
+DEFAULT_COOLDOWN = 30.0
+MAX_COOLDOWN = 600.0
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose breaker is open."""
+
+    def __init__(self, endpoint, retry_in):
+        super().__init__(f"GatewayAPI {endpoint} unavailable, circuit open (next probe in {retry_in:.0f}s)")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+
+    def __init__(self, endpoint, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 latency_threshold=DEFAULT_LATENCY_THRESHOLD, cooldown=DEFAULT_COOLDOWN):
+        self.endpoint = endpoint
+        self.failure_threshold = max(int(failure_threshold or DEFAULT_FAILURE_THRESHOLD), 1)
+        self.latency_threshold = latency_threshold or 0.0  # 0 disables the latency check
+        self.base_cooldown = cooldown or DEFAULT_COOLDOWN
+        self.cooldown = self.base_cooldown
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise :class:`CircuitOpenError` unless a call may go through."""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            now = time.monotonic()
+            retry_in = self.opened_at + self.cooldown - now
+            if self.state == OPEN and retry_in <= 0:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probing:
+                _logger.info("GatewayAPI circuit %s half-open, probing", self.endpoint)
+                self._probing = True
+                return
+            raise CircuitOpenError(self.endpoint, max(retry_in, 0.0))
+
+    def record(self, ok, latency):
+        """Record the outcome of a call let through by :meth:`before_call`."""
+        if ok and self.latency_threshold and latency > self.latency_threshold:
+            ok = False
+        with self._lock:
+            if ok:
+                if self.state != CLOSED:
+                    _logger.info("GatewayAPI circuit %s closed", self.endpoint)
+                self.state = CLOSED
+                self.failures = 0
+                self.cooldown = self.base_cooldown
+                self._probing = False
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                self.cooldown = min(self.cooldown * 2, MAX_COOLDOWN)
+            elif self.state == OPEN or self.failures < self.failure_threshold:
+                return
+            _logger.warning("GatewayAPI circuit %s open after %s failures, next probe in %.0fs",
+                            self.endpoint, self.failures, self.cooldown)
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self._probing = False
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""Shared HTTP client for the GatewayAPI REST endpoints.
+
+One client is kept per ``iap.account`` and per worker process. Each client
+owns a ``requests.Session`` with a bounded connection pool so consecutive
+calls reuse the same keep-alive TCP/TLS connection to GatewayAPI, and every
+call carries a (connect, read) timeout so a hung socket cannot block an Odoo
+worker forever. Each endpoint is guarded by a circuit breaker so an outage
+makes calls fail fast instead of waiting for those timeouts.
+"""
+
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import gatewayapi_circuit, gatewayapi_metrics
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = 'https://gatewayapi.eu'
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 30.0
+DEFAULT_POOL_SIZE = 10
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class GatewayApiClient:
+    """Thin wrapper around a pooled ``requests.Session``."""
+
+    def __init__(self, base_url, token, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, pool_size=DEFAULT_POOL_SIZE, circuit=None):
+        self.config = (base_url, token, connect_timeout, read_timeout, pool_size, circuit)
+        self.base_url = (base_url or DEFAULT_BASE_URL).rstrip('/')
+        self.timeout = (connect_timeout or DEFAULT_CONNECT_TIMEOUT,
+                        read_timeout or DEFAULT_READ_TIMEOUT)
+        pool_size = max(int(pool_size or DEFAULT_POOL_SIZE), 1)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['Authorization'] = f'Token {token}'
+        # (failure threshold, latency threshold, cooldown) of the breakers
+        self.circuit = circuit or ()
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+
+    def breaker(self, path):
+        """Return the circuit breaker guarding the endpoint ``path``."""
+        with self._breakers_lock:
+            breaker = self._breakers.get(path)
+            if breaker is None:
+                breaker = self._breakers[path] = gatewayapi_circuit.CircuitBreaker(path, *self.circuit)
+            return breaker
+
+    def request(self, method, path, endpoint=None, **kwargs):
+        """Call ``path``; raises :class:`~.gatewayapi_circuit.CircuitOpenError`
+        without any network access while its breaker is open.
+
+        :param endpoint: name of the breaker and metrics label, defaults to
+            ``path``; set it for paths holding ids, e.g. ``/rest/mtsms/{id}``
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        endpoint = endpoint or path
+        breaker = self.breaker(endpoint)
+        try:
+            breaker.before_call()
+        except gatewayapi_circuit.CircuitOpenError:
+            gatewayapi_metrics.HTTP_REQUESTS.inc(endpoint=endpoint, status='circuit_open')
+            raise
+        start = time.monotonic()
+        try:
+            response = self.session.request(method, self.base_url + path, **kwargs)
+        except BaseException:
+            # Whatever the error, a half-open breaker must learn how its
+            # probe ended or it would never let another one through.
+            latency = time.monotonic() - start
+            breaker.record(False, latency)
+            gatewayapi_metrics.HTTP_REQUESTS.inc(endpoint=endpoint, status='error')
+            gatewayapi_metrics.HTTP_LATENCY.observe(latency, endpoint=endpoint)
+            raise
+        latency = time.monotonic() - start
+        # 4xx answers mean GatewayAPI is up, only 5xx count against it
+        breaker.record(response.status_code < 500, latency)
+        gatewayapi_metrics.HTTP_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+        gatewayapi_metrics.HTTP_LATENCY.observe(latency, endpoint=endpoint)
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def close(self):
+        """Close the pooled connections; requests in flight still complete."""
+        self.session.close()
+
+
+def get_client(account_id, base_url, token, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+               read_timeout=DEFAULT_READ_TIMEOUT, pool_size=DEFAULT_POOL_SIZE, circuit=None):
+    """Return the shared client of an account, rebuilding it if its
+    configuration changed since it was created."""
+    config = (base_url, token, connect_timeout, read_timeout, pool_size, circuit)
+    with _clients_lock:
+        client = _clients.get(account_id)
+        if client is None or client.config != config:
+            _logger.debug("GatewayAPI: creating HTTP client for account %s", account_id)
+            if client is not None:
+                client.close()
+            client = _clients[account_id] = GatewayApiClient(*config)
+        return client
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one execution.
+
+    The first caller of :meth:`do` for a key runs the function; callers
+    arriving while it is in flight wait for it and get its result (or its
+    exception) instead of running the function again.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function, timeout=None):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = {'done': threading.Event(), 'result': None, 'error': None}
+        if not leader:
+            if not flight['done'].wait(timeout):
+                raise TimeoutError(f"GatewayAPI: timed out waiting for the in-flight call {key}")
+            if flight['error'] is not None:
+                raise flight['error']
+            return flight['result']
+        try:
+            flight['result'] = function()
+            return flight['result']
+        except Exception as e:
+            flight['error'] = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight['done'].set()
+
+
+# In-flight /rest/me calls, per account
+balance_flights = SingleFlight()
+
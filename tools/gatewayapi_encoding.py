@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""GSM 03.38 / UCS-2 classification and segment counting for SMS bodies.
+
+A body that only uses characters of the GSM-7 basic and extension tables is
+sent as GSM-7, anything else needs UCS-2. Results are cached per distinct
+body, so classifying a campaign that sends one text to many recipients costs
+a single pass over that text.
+"""
+
+import functools
+import math
+
+GSM7 = 'GSM7'
+UCS2 = 'UCS2'
+
+GSM7_BASIC_CHARS = frozenset(
+    '@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞ\x1bÆæßÉ'
+    ' !"#¤%&\'()*+,-./0123456789:;<=>?'
+    '¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§'
+    '¿abcdefghijklmnopqrstuvwxyzäöñüà'
+)
+# Extension table characters take two septets (escape + character).
+GSM7_EXTENSION_CHARS = frozenset('\f^{}\\[~]|€')
+
+# (single segment capacity, capacity per segment of a concatenated message)
+SEGMENT_LIMITS = {
+    GSM7: (160, 153),
+    UCS2: (70, 67),
+}
+
+
+@functools.lru_cache(maxsize=4096)
+def classify(body):
+    """Return ``(encoding, units, segments)`` for one SMS body.
+
+    ``units`` are GSM-7 septets or UTF-16 code units depending on the
+    encoding.
+    """
+    body = body or ''
+    septets = 0
+    for char in body:
+        if char in GSM7_BASIC_CHARS:
+            septets += 1
+        elif char in GSM7_EXTENSION_CHARS:
+            septets += 2
+        else:
+            encoding = UCS2
+            units = len(body.encode('utf-16-le')) // 2
+            break
+    else:
+        encoding = GSM7
+        units = septets
+    single, multi = SEGMENT_LIMITS[encoding]
+    segments = 1 if units <= single else math.ceil(units / multi)
+    return encoding, units, segments
+
+
+def classify_many(bodies):
+    """Classify an iterable of bodies in one pass.
+
+    Returns a dict mapping each distinct body to its
+    ``(encoding, units, segments)`` tuple.
+    """
+    return {body: classify(body) for body in set(bodies)}
+
+
+def needs_ucs2(body):
+    return classify(body)[0] == UCS2
+
+
+def count_segments(body):
+    return classify(body)[2]
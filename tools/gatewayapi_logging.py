@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""Per-subsystem loggers and aggregated summary lines.
+
+Each subsystem logs under its own logger, so its level can be tuned with
+Odoo's ``--log-handler`` option without touching the others, e.g.::
+
+    --log-handler=odoo.addons.gatewayapi_sms.send:WARNING
+    --log-handler=odoo.addons.gatewayapi_sms.dlr:DEBUG
+
+Hot paths do not log one line per batch or per report at INFO level; they
+feed a ``LogSummary`` that emits a single aggregated line per interval.
+"""
+
+import collections
+import logging
+import threading
+import time
+
+SEND = 'send'
+DLR = 'dlr'
+BALANCE = 'balance'
+
+SUMMARY_INTERVAL = 60.0  # seconds
+
+LOGGER_ROOT = __name__.rsplit('.', 2)[0]  # odoo.addons.<module>
+
+
+def get_logger(subsystem):
+    return logging.getLogger(f'{LOGGER_ROOT}.{subsystem}')
+
+
+class LogSummary:
+    """Accumulate counters and log them as one INFO line per interval."""
+
+    def __init__(self, logger, title, interval=SUMMARY_INTERVAL):
+        self.logger = logger
+        self.title = title
+        self.interval = interval
+        self._counts = collections.Counter()
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._counts.update(counts)
+            elapsed = now - self._started
+            if elapsed < self.interval:
+                return
+            snapshot, self._counts = self._counts, collections.Counter()
+            self._started = now
+        self.logger.info(
+            "%s over the last %ds: %s", self.title, elapsed,
+            ", ".join(f"{key}={value}" for key, value in sorted(snapshot.items())),
+        )
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""In-process metrics of the GatewayAPI integration.
+
+Counters and histograms are plain Python objects updated under a lock, cheap
+enough for the send and webhook hot paths. :func:`render` exports them in the
+Prometheus text format for the ``/gatewayapi/metrics`` route.
+
+Every Odoo worker process keeps its own values, so all samples carry a
+``pid`` label: a scrape that lands on another worker shows other series
+instead of counters that seem to go backwards.
+"""
+
+import bisect
+import os
+import threading
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LAG_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 300.0, 900.0, 3600.0, 21600.0, 86400.0)
+SIZE_BUCKETS = (1, 5, 10, 50, 100, 200, 500, 1000)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = [*zip(labelnames, values), *extra, ('pid', os.getpid())]
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        # The text format names the family like its samples
+        self.family = f'{name}_total'
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f'{self.family}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class Histogram:
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS, labelnames=()):
+        self.name = name
+        self.family = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        # label values -> [bucket counts (+Inf last), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else _format_value(float(bound))
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, key, [("le", le)])} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, key)} {count}'
+
+
+def _register(metric):
+    with _registry_lock:
+        _registry.append(metric)
+    return metric
+
+
+def counter(name, documentation, labelnames=()):
+    return _register(Counter(name, documentation, labelnames))
+
+
+def histogram(name, documentation, buckets=LATENCY_BUCKETS, labelnames=()):
+    return _register(Histogram(name, documentation, buckets, labelnames))
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (0.0.4)."""
+    lines = []
+    with _registry_lock:
+        metrics = list(_registry)
+    for metric in metrics:
+        lines.append(f'# HELP {metric.family} {metric.documentation}')
+        lines.append(f'# TYPE {metric.family} {metric.kind}')
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+
+SMS_SENT = counter('gatewayapi_sms_sent', "SMS accepted by GatewayAPI.")
+SMS_FAILED = counter('gatewayapi_sms_failed', "SMS that could not be sent, by failure type.", ['failure_type'])
+HTTP_REQUESTS = counter('gatewayapi_http_requests', "Calls to the GatewayAPI REST API, by endpoint and HTTP status.",
+                        ['endpoint', 'status'])
+HTTP_LATENCY = histogram('gatewayapi_http_request_seconds', "Duration of GatewayAPI REST calls, by endpoint.",
+                         labelnames=['endpoint'])
+BATCH_SIZE = histogram('gatewayapi_batch_size', "SMS per /rest/mtsms request.", SIZE_BUCKETS)
+BATCH_BYTES = histogram('gatewayapi_batch_payload_bytes', "Size of the /rest/mtsms request bodies.", BYTES_BUCKETS)
+POSTPROCESS_LATENCY = histogram('gatewayapi_postprocess_seconds', "Duration of _postprocess_iap_sent_sms.")
+DLR_REPORTS = counter('gatewayapi_dlr_reports', "Delivery reports applied, by GatewayAPI status.", ['status'])
+DLR_LAG = histogram('gatewayapi_dlr_lag_seconds', "Time from sending an SMS to applying its delivery report.",
+                    LAG_BUCKETS)
+DLR_RECONCILED = counter('gatewayapi_dlr_reconciled', "Delivery reports recovered by polling GatewayAPI, by status.",
+                         ['status'])
+WEBHOOK_LATENCY = histogram('gatewayapi_webhook_seconds', "Handling time of the /gatewayapi/dlr webhook, by mode.",
+                            labelnames=['mode'])
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""Retry policy for transient GatewayAPI failures.
+
+Only failures where GatewayAPI cannot have accepted the batch are retried:
+connection errors raised before the request was sent, 429 and 503 answers.
+They are retried with exponential backoff and full jitter, honouring the
+``Retry-After`` header. Read timeouts, connections dropped after sending and
+other 5xx answers are ambiguous, the messages may have gone out: resending
+them could deliver every SMS twice, so they are never retried.
+"""
+
+import email.utils
+import random
+import time
+
+import requests
+from urllib3.exceptions import ConnectTimeoutError
+
+RETRYABLE_STATUS_CODES = frozenset({429, 503})
+# GatewayAPI (or a proxy in front of it) may have processed the request
+AMBIGUOUS_STATUS_CODES = frozenset({500, 502, 504})
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BASE_DELAY = 0.5  # seconds
+DEFAULT_MAX_DELAY = 30.0  # seconds
+DEFAULT_MAX_PARKS = 5
+PARK_BASE_DELAY = 60  # seconds
+PARK_MAX_DELAY = 3600  # seconds
+
+
+def parse_retry_after(value):
+    """Return the number of seconds a ``Retry-After`` header asks to wait,
+    or None when it is missing or malformed."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+def status_code(error):
+    response = getattr(error, 'response', None)
+    return response.status_code if response is not None else None
+
+
+def is_connect_error(error):
+    """Whether ``error`` was raised while connecting, before anything was sent."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.exceptions.ConnectionError):
+        return False
+    reason = error.args[0] if error.args else None
+    # urllib3 wraps the cause in a MaxRetryError; NewConnectionError (DNS,
+    # refused connections) is a ConnectTimeoutError too.
+    return isinstance(getattr(reason, 'reason', reason), ConnectTimeoutError)
+
+
+def is_ambiguous(error):
+    """Whether GatewayAPI may have accepted the request that raised ``error``."""
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return not is_connect_error(error)
+    if isinstance(error, requests.exceptions.Timeout):
+        return True
+    return status_code(error) in AMBIGUOUS_STATUS_CODES
+
+
+class RetryPolicy:
+
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY):
+        self.max_attempts = max(int(max_attempts or 1), 1)
+        self.base_delay = max(base_delay or 0.0, 0.0)
+        self.max_delay = max(max_delay or 0.0, 0.0)
+
+    def is_retryable(self, error):
+        return is_connect_error(error) or status_code(error) in RETRYABLE_STATUS_CODES
+
+    def delay(self, attempt, error):
+        """Seconds to wait before attempt ``attempt + 1``, or None when the
+        gateway asks for a longer pause than ``max_delay``: the batch should
+        then be parked rather than hold the worker."""
+        response = getattr(error, 'response', None)
+        retry_after = parse_retry_after(response.headers.get('Retry-After')) if response is not None else None
+        if retry_after is not None and retry_after > self.max_delay:
+            return None
+        backoff = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return max(random.uniform(0, backoff), retry_after or 0.0)
+
+
+def park_delay(park_count):
+    """Seconds a parked SMS waits before its ``park_count``-th new attempt."""
+    backoff = min(PARK_MAX_DELAY, PARK_BASE_DELAY * 2 ** max(park_count - 1, 0))
+    return random.uniform(backoff / 2, backoff)
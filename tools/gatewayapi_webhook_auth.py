@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""JWT verification for the GatewayAPI delivery report webhook.
+
+Tokens are checked against every active secret, so a new secret can be
+rolled out while GatewayAPI still signs with the previous one. Successfully
+verified tokens are remembered in a small per-worker LRU until they expire,
+so bursts of reports carrying the same signature are only decoded once.
+"""
+
+import collections
+import threading
+import time
+
+import jwt
+
+VERIFIED_CACHE_SIZE = 1024
+VERIFIED_CACHE_TTL = 300  # seconds
+
+_verified = collections.OrderedDict()
+_verified_lock = threading.Lock()
+
+
+def verify(token, secrets):
+    """Verify ``token`` against the active ``secrets`` (a tuple, current
+    secret first).
+
+    Raises ``jwt.ExpiredSignatureError`` if a secret matches but the token
+    has expired, ``jwt.InvalidTokenError`` if no secret matches.
+    """
+    key = (token, secrets)
+    now = time.time()
+    with _verified_lock:
+        expires_at = _verified.get(key)
+        if expires_at is not None:
+            if expires_at > now:
+                _verified.move_to_end(key)
+                return
+            del _verified[key]
+
+    error = jwt.InvalidTokenError("No JWT secret configured")
+    for secret in secrets:
+        try:
+            claims = jwt.decode(token, secret, algorithms=['HS256'])
+        except jwt.ExpiredSignatureError:
+            raise
+        except jwt.InvalidTokenError as e:
+            error = e
+            continue
+        expires_at = now + VERIFIED_CACHE_TTL
+        if isinstance(claims.get('exp'), (int, float)):
+            expires_at = min(expires_at, claims['exp'])
+        with _verified_lock:
+            _verified[key] = expires_at
+            _verified.move_to_end(key)
+            while len(_verified) > VERIFIED_CACHE_SIZE:
+                _verified.popitem(last=False)
+        return
+    raise error